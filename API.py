@@ -1,23 +1,35 @@
 import uvicorn
 from fastapi import FastAPI
+from utils.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from scheme.models import User
-from routes import auth
-from routes.messages import messages, messages_feedback
-from routes.posts import posts
-from utils.sqlalchemy import SessionLocal
+from fastapi.responses import PlainTextResponse
+from routes import auth, users
+from routes.messages import messages, messages_feedback, messages_ws
+from routes.posts import posts, feed
+from utils.sqlalchemy import engine, read_engine, warm_up_pools
+from utils.broker import broker
+from utils.jwt import revoked_tokens
+from utils.replicas import replica_monitor, ReadYourWritesMiddleware
+from utils.timelines import fanout_resumer
+from utils.metrics import MetricsMiddleware, render
+from utils.queries import QueryStatsMiddleware
 
 # Инициализация приложения
 app = FastAPI(
     title='Social Network',
-    version='1.0.0'
+    version='1.0.0',
+    # Ответы сериализуются orjson
+    default_response_class=ORJSONResponse
 )
 
 # Подключение маршрутов
 app.include_router(auth.router)
+app.include_router(users.router)
 app.include_router(messages.router)
 app.include_router(messages_feedback.router)
+app.include_router(messages_ws.router)
 app.include_router(posts.router)
+app.include_router(feed.router)
 
 # Настройки CORS
 origins = [
@@ -34,23 +46,48 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Закрепление клиента за основной БД после записи (cookie)
+app.add_middleware(ReadYourWritesMiddleware)
+# Подсчёт SQL-запросов на запрос (заголовок Server-Timing)
+app.add_middleware(QueryStatsMiddleware)
+# Метрики запросов (внешний слой, учитывает и время остальных middleware)
+app.add_middleware(MetricsMiddleware)
 
-@app.get("/users", tags=["Users"])
-async def read_users():
+@app.on_event("startup")
+async def start_broker():
+    # Открытие соединений пула БД заранее, до первых запросов
+    await warm_up_pools()
+    # Запуск брокера событий чата
+    await broker.start()
+    # Загрузка отозванных токенов и запуск их периодического обновления
+    await revoked_tokens.start()
+    # Запуск проверки отставания реплики для чтения
+    await replica_monitor.start()
+    # Запуск возобновления рассылки постов авторов, у которых стало меньше подписчиков
+    await fanout_resumer.start()
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    # Остановка брокера и закрытие всех соединений пула БД при остановке приложения
+    await broker.stop()
+    await revoked_tokens.stop()
+    await replica_monitor.stop()
+    await fanout_resumer.stop()
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
     """
-    # Маршрут для получения списка всех пользователей
+    # Маршрут для выдачи метрик в формате Prometheus
     """
-    # Создание сессии БД
-    db = SessionLocal()
-    # Получение всех пользователей из БД
-    users = db.query(User).all()
-    # Закрытие сессии БД
-    db.close()
-    # Возвращаем id и имена всех пользователей
-    return [{"id": user.id, "username": user.username} for user in users]
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
 
 # uvicorn API:app --reload --port 9999
 
+# Запуск для разработки (один воркер с перезагрузкой),
+# в боевом режиме приложение запускается через serve.py
 if __name__ == '__main__':
     uvicorn.run(
         'API:app', port=5050, host='127.0.0.1',
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+# Запуск из корневого каталога репозитория: python3 -m benchmarks.bench
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import text
+
+# Замеры измеряют сами маршруты: ограничения нагрузки отключаются, если не заданы явно
+os.environ.setdefault("ADMISSION_CONTROL", "false")
+
+from API import app
+from config import DB_NAME
+from utils.passwords import hash_password
+from utils.sqlalchemy import engine
+
+# Пароль всех пользователей, созданных для замеров
+BENCH_PASSWORD = "benchmark"
+# Таблицы, которые очищаются перед заполнением (--reset)
+TABLES = ("collection_versions", "conversations", "timelines", "follows", "post_reactions", "posts",
+          "message_reactions", "messages", "tokens", "users")
+
+
+# Функция для заполнения БД тестовыми данными одним запросом на таблицу
+async def seed(users, posts, messages):
+    password_hash = await hash_password(BENCH_PASSWORD)
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO users (username, password_hash, followers_count) "
+            "SELECT 'seed_' || g, :password_hash, 0 FROM generate_series(1, :n) g"
+        ), {"password_hash": password_hash, "n": users})
+        await conn.execute(text(
+            "INSERT INTO posts (id, user_id, post, likes_count, dislikes_count, created_at) "
+            "SELECT gen_random_uuid(), u.id, 'seed post ' || g, 0, 0, "
+            "       now() - g * interval '1 second' "
+            "FROM generate_series(1, :n) g "
+            "JOIN users u ON u.username = 'seed_' || (1 + g % :users)"
+        ), {"n": posts, "users": users})
+        await conn.execute(text(
+            "INSERT INTO messages (id, sender_id, recipient_id, message, created_at, "
+            "                      is_deleted, likes_count, dislikes_count) "
+            "SELECT gen_random_uuid(), s.id, r.id, 'seed message ' || g, "
+            "       now() - g * interval '1 second', false, 0, 0 "
+            "FROM generate_series(1, :n) g "
+            "JOIN users s ON s.username = 'seed_' || (1 + g % :users) "
+            "JOIN users r ON r.username = 'seed_' || (1 + (g * 7) % :users)"
+        ), {"n": messages, "users": users})
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+
+
+# Функция для подготовки БД: пустая БД заполняется, непустая очищается только с --reset
+async def prepare_database(args):
+    async with engine.begin() as conn:
+        existing = await conn.scalar(text("SELECT count(*) FROM users"))
+        if existing and not args.reset:
+            raise SystemExit(f"В БД {DB_NAME} уже есть пользователи ({existing}). "
+                             "Замеры очищают таблицы: запустите с --reset на отдельной БД")
+        await conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+    await seed(args.users, args.posts, args.messages)
+
+
+# Контекст замеров: клиенты-пользователи с токенами и их данные
+class Context:
+    def __init__(self, client):
+        self.client = client
+        self.headers = []
+        self.user_ids = []
+        self.post_ids = []
+        self.own_posts = {}
+
+    # Функция для регистрации и входа пользователя, возвращает заголовки с токеном
+    async def login(self, username):
+        await self.client.post("/auth/signup", json={"username": username, "password": BENCH_PASSWORD})
+        response = await self.client.post("/auth/signin",
+                                          data={"username": username, "password": BENCH_PASSWORD})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def setup(self, clients):
+        for index in range(clients):
+            self.headers.append(await self.login(f"bench_{index}"))
+        async with engine.connect() as conn:
+            self.user_ids = list((await conn.scalars(text(
+                "SELECT id FROM users WHERE username LIKE 'bench\\_%' ORDER BY id"))).all())
+            self.post_ids = list((await conn.scalars(text(
+                "SELECT id FROM posts ORDER BY created_at DESC LIMIT 1000"))).all())
+
+    # Функция для создания постов пользователя напрямую в БД (не входит в замер)
+    async def create_posts(self, client_index, count):
+        ids = [uuid.uuid4() for _ in range(count)]
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO posts (id, user_id, post, likes_count, dislikes_count, created_at) "
+                "VALUES (:id, :user_id, 'bench post', 0, 0, now())"
+            ), [{"id": post_id, "user_id": self.user_ids[client_index]} for post_id in ids])
+        self.own_posts.setdefault(client_index, []).extend(ids)
+
+
+# Сценарии замеров: (название, подготовка, запрос, допустимые статусы).
+# Запрос получает контекст, номер клиента и номер запроса
+async def signup(ctx, client, i):
+    return await ctx.client.post("/auth/signup", json={
+        "username": f"signup_{uuid.uuid4().hex[:12]}", "password": BENCH_PASSWORD})
+
+async def signin(ctx, client, i):
+    return await ctx.client.post("/auth/signin", data={
+        "username": f"bench_{client}", "password": BENCH_PASSWORD})
+
+async def post_create(ctx, client, i):
+    return await ctx.client.post("/blog/post", json={"post": f"bench post {i}"},
+                                 headers=ctx.headers[client])
+
+async def posts_list(ctx, client, i):
+    return await ctx.client.get("/blog/posts", headers=ctx.headers[client])
+
+# Каждому клиенту хватает постов, даже если он выполнит все запросы сценария
+async def prepare_own_posts(ctx, clients, requests):
+    for client in range(clients):
+        await ctx.create_posts(client, requests)
+
+async def post_edit(ctx, client, i):
+    post_id = ctx.own_posts[client][i % len(ctx.own_posts[client])]
+    return await ctx.client.put(f"/blog/post/{post_id}", json={"post": f"edited {i}"},
+                                headers=ctx.headers[client])
+
+async def post_delete(ctx, client, i):
+    post_id = ctx.own_posts[client].pop()
+    return await ctx.client.delete(f"/blog/post/{post_id}", headers=ctx.headers[client])
+
+async def post_reaction(ctx, client, i):
+    post_id = random.choice(ctx.post_ids)
+    return await ctx.client.post(f"/blog/post/{post_id}/reaction",
+                                 json={"type": random.choice(("like", "dislike"))},
+                                 headers=ctx.headers[client])
+
+async def message_send(ctx, client, i):
+    recipient_id = ctx.user_ids[(client + 1) % len(ctx.user_ids)]
+    return await ctx.client.post("/chat/messages",
+                                 json={"recipient_id": recipient_id, "message": f"bench {i}"},
+                                 headers=ctx.headers[client])
+
+async def inbox_read(ctx, client, i):
+    return await ctx.client.get(f"/chat/messages/{ctx.user_ids[client]}",
+                                headers=ctx.headers[client])
+
+SCENARIOS = [
+    ("signup", None, signup, {200}),
+    ("signin", None, signin, {200}),
+    ("post_create", None, post_create, {200}),
+    ("posts_list", None, posts_list, {200}),
+    ("post_edit", prepare_own_posts, post_edit, {200}),
+    ("post_delete", prepare_own_posts, post_delete, {200}),
+    # повторная такая же реакция возвращает 400 и тоже считается ответом
+    ("post_reaction", None, post_reaction, {200, 400}),
+    ("message_send", None, message_send, {200}),
+    ("inbox_read", None, inbox_read, {200}),
+]
+
+
+# Функция для вычисления перцентилей задержки в миллисекундах
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p95_ms": round(quantiles[94] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+# Функция для замера одного сценария: clients параллельных клиентов
+# выполняют requests запросов в сумме
+async def run_scenario(ctx, request, statuses, clients, requests):
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker(client):
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await request(ctx, client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code not in statuses:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in range(clients)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+# Функция для получения текущего коммита (для сравнения запусков)
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    await prepare_database(args)
+    selected = set(args.only.split(",")) if args.only else None
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            ctx = Context(client)
+            await ctx.setup(args.concurrency)
+            results = {}
+            for name, prepare, request, statuses in SCENARIOS:
+                if selected and name not in selected:
+                    continue
+                if prepare:
+                    await prepare(ctx, args.concurrency, args.requests + args.warmup)
+                # Прогрев: первые запросы не учитываются
+                await run_scenario(ctx, request, statuses, args.concurrency, args.warmup)
+                results[name] = await run_scenario(ctx, request, statuses,
+                                                   args.concurrency, args.requests)
+                print_row(name, results[name])
+    finally:
+        await app.router.shutdown()
+
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "users": args.users,
+            "posts": args.posts,
+            "messages": args.messages,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "routes": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+def print_row(name, result):
+    print(f"{name:<16} {result['rps']:>9} rps  p50 {result['p50_ms']:>8} ms  "
+          f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+
+
+# Функция для сравнения двух файлов результатов: изменение p50/p95/p99 и rps в процентах
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["routes"]
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)["routes"]
+    metrics = ("rps", "p50_ms", "p95_ms", "p99_ms")
+    print(f"{'route':<16}" + "".join(f"{metric:>22}" for metric in metrics))
+    for name in baseline:
+        if name not in candidate:
+            continue
+        cells = []
+        for metric in metrics:
+            old, new = baseline[name][metric], candidate[name][metric]
+            change = (new - old) / old * 100 if old else 0.0
+            cells.append(f"{old:>8} → {new:<8} {change:+5.0f}%")
+        print(f"{name:<16}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры задержки и пропускной способности маршрутов API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="выполнить замеры и записать результаты в JSON")
+    run_parser.add_argument("--users", type=int, default=1000, help="пользователей в БД")
+    run_parser.add_argument("--posts", type=int, default=10000, help="постов в БД")
+    run_parser.add_argument("--messages", type=int, default=10000, help="сообщений в БД")
+    run_parser.add_argument("--requests", type=int, default=500, help="запросов на маршрут")
+    run_parser.add_argument("--warmup", type=int, default=20, help="запросов прогрева на маршрут")
+    run_parser.add_argument("--concurrency", type=int, default=10, help="параллельных клиентов")
+    run_parser.add_argument("--only", help="только указанные сценарии через запятую")
+    run_parser.add_argument("--reset", action="store_true", help="очистить непустую БД перед замерами")
+    run_parser.add_argument("--output", default="benchmark.json", help="файл результатов")
+
+    compare_parser = commands.add_parser("compare", help="сравнить два файла результатов")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        asyncio.run(run(args))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
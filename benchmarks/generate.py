@@ -0,0 +1,391 @@
+import argparse
+import datetime
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from array import array
+from collections import Counter
+
+# Запуск из корневого каталога репозитория: python3 -m benchmarks.generate
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from passlib.hash import bcrypt
+
+from config import (DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME, BCRYPT_ROUNDS,
+                    FEED_FANOUT_LIMIT, FEED_BACKFILL_SIZE, CONVERSATION_PREVIEW_LENGTH)
+
+# Параметр распределения Парето для активности и популярности пользователей:
+# чем меньше, тем сильнее перекос (несколько "звёзд" и длинный хвост)
+PARETO_ALPHA = 1.2
+# Доля событий, которые приходятся на всплески активности, и длительность всплеска
+BURST_SHARE = 0.4
+BURST_WIDTH = datetime.timedelta(hours=2)
+# Таблицы, которые заполняет генератор
+TABLES = ("collection_versions", "conversations", "timelines", "follows", "post_reactions", "posts",
+          "message_reactions", "messages", "tokens", "users")
+# Размер строк, передаваемых в COPY за одно чтение
+COPY_CHUNK = 1 << 16
+
+
+# Поток строк для COPY: psycopg2 читает его как файл,
+# строки генерируются по мере чтения и не копятся в памяти
+class RowStream:
+    def __init__(self, rows):
+        self.lines = ("\t".join(row) + "\n" for row in rows)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = "".join(itertools.islice(self.lines, 1000))
+            if not chunk:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+# Функция для выполнения SQL с выводом времени выполнения
+def execute(conn, title, sql, params=None):
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        count = cursor.rowcount
+    conn.commit()
+    print(f"{title:<18} {count:>10} строк за {time.perf_counter() - started:6.1f} с")
+
+
+# Функция для удаления вторичных индексов загружаемых таблиц перед загрузкой:
+# построить индекс по готовым данным быстрее, чем обновлять его на каждой строке.
+# Первичные ключи и ограничения уникальности остаются. Возвращает определения индексов
+def drop_indexes(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = ANY(%s)
+              AND indexname NOT IN (SELECT conname FROM pg_constraint)
+        """, (list(TABLES),))
+        indexes = cursor.fetchall()
+        for index_name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{index_name}"')
+    conn.commit()
+    return [index_def for _, index_def in indexes]
+
+
+# Функция для создания удалённых перед загрузкой индексов
+def create_indexes(conn, index_defs):
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute("SET maintenance_work_mem = '512MB'")
+        for index_def in index_defs:
+            cursor.execute(index_def)
+    conn.commit()
+    print(f"{'indexes':<18} {len(index_defs):>10} шт.   за {time.perf_counter() - started:6.1f} с")
+
+
+# Выбор с весами: кумулятивные веса хранятся в array('d'),
+# чтобы миллионы весов занимали мало памяти
+class WeightedPicker:
+    def __init__(self, rng, count, alpha=PARETO_ALPHA):
+        self.population = range(count)
+        self.cum_weights = array("d", itertools.accumulate(
+            rng.paretovariate(alpha) for _ in range(count)))
+
+    def pick(self, rng, k=1):
+        return rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+
+
+# Время событий: часть событий равномерно распределена по периоду,
+# остальные приходятся на всплески активности
+class BurstyClock:
+    def __init__(self, rng, start, end, bursts):
+        self.start = start
+        self.end = end
+        self.span = (end - start).total_seconds()
+        self.bursts = [start + datetime.timedelta(seconds=rng.uniform(0, self.span))
+                       for _ in range(bursts)]
+
+    def sample(self, rng):
+        if rng.random() < BURST_SHARE:
+            moment = rng.choice(self.bursts) + datetime.timedelta(
+                seconds=rng.expovariate(1 / BURST_WIDTH.total_seconds()))
+            return min(moment, self.end)
+        return self.start + datetime.timedelta(seconds=rng.uniform(0, self.span))
+
+
+# Синтетический словарь с распределением Ципфа для текстов постов и сообщений
+class TextGenerator:
+    SYLLABLES = ("ка", "ло", "ми", "ре", "то", "на", "ви", "су", "ba", "ko",
+                 "ri", "te", "lo", "ma", "ne", "po", "da", "zu")
+
+    def __init__(self, rng, words=5000):
+        self.words = ["".join(rng.choice(self.SYLLABLES) for _ in range(rng.randint(2, 4)))
+                      for _ in range(words)]
+        self.cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, words + 1)))
+
+    def sentence(self, rng, min_words, max_words):
+        return " ".join(rng.choices(self.words, cum_weights=self.cum_weights,
+                                    k=rng.randint(min_words, max_words)))
+
+
+# Функция для распределения total связей между пользователями по весам
+# активности. Возвращает Counter {номер пользователя: количество связей}
+def degrees(rng, picker, total):
+    result = Counter()
+    remaining = total
+    while remaining:
+        batch = min(remaining, 1_000_000)
+        result.update(picker.pick(rng, batch))
+        remaining -= batch
+    return result
+
+
+# Функция для выбора k разных целей по популярности (кроме исключённой)
+def distinct_targets(rng, picker, k, exclude=None):
+    targets = set()
+    attempts = 0
+    while len(targets) < k and attempts < 5:
+        for target in picker.pick(rng, k - len(targets)):
+            if target != exclude:
+                targets.add(target)
+        attempts += 1
+    return targets
+
+
+# Генератор строк таблиц. Данные делятся на jobs частей, которые загружаются
+# параллельно: веса, словарь и всплески одинаковы во всех частях (общее зерно),
+# а случайный выбор в каждой части свой
+class Generator:
+    def __init__(self, args, job=0, jobs=1):
+        self.args = args
+        self.job = job
+        self.jobs = jobs
+        shared = random.Random(args.seed)
+        self.clock = BurstyClock(shared, args.start, args.end, bursts=max(1, args.days * 3))
+        self.text = TextGenerator(shared)
+        # Активность (кто пишет) и популярность (кому пишут, на кого подписываются)
+        # распределены по Парето независимо друг от друга
+        self.activity = WeightedPicker(shared, args.users)
+        self.popularity = WeightedPicker(shared, args.users)
+        # id постов вычисляются по номеру, чтобы не хранить миллионы UUID в памяти
+        self.post_base = shared.getrandbits(64) << 64
+        self.shared_seed = shared.getrandbits(64)
+        self.rng = random.Random(f"{args.seed}:{job}")
+
+    def user_id(self, index):
+        return str(index + 1)
+
+    def post_id(self, index):
+        return str(uuid.UUID(int=self.post_base | index))
+
+    # Количество строк этой части из total
+    def share(self, total):
+        return total // self.jobs + (self.job < total % self.jobs)
+
+    def users(self):
+        password_hash = bcrypt.using(rounds=BCRYPT_ROUNDS).hash(self.args.password)
+        for index in range(self.job, self.args.users, self.jobs):
+            yield (self.user_id(index), f"user{index + 1}", password_hash, "0")
+
+    def posts(self):
+        rng = self.rng
+        indexes = range(self.job, self.args.posts, self.jobs)
+        for offset in range(0, len(indexes), 10_000):
+            batch = indexes[offset:offset + 10_000]
+            for index, author in zip(batch, self.activity.pick(rng, len(batch))):
+                yield (self.post_id(index), self.user_id(author), self.text.sentence(rng, 3, 40),
+                       "0", "0", self.clock.sample(rng).isoformat(), "\\N")
+
+    def messages(self):
+        rng = self.rng
+        total = self.share(self.args.messages)
+        for offset in range(0, total, 10_000):
+            batch = min(10_000, total - offset)
+            senders = self.activity.pick(rng, batch)
+            recipients = self.popularity.pick(rng, batch)
+            for sender, recipient in zip(senders, recipients):
+                if sender == recipient:
+                    recipient = (recipient + 1) % self.args.users
+                yield (str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                       self.user_id(sender), self.user_id(recipient),
+                       self.text.sentence(rng, 1, 25), self.clock.sample(rng).isoformat(), "\\N",
+                       "t" if rng.random() < self.args.deleted_share else "f", "0", "0")
+
+    # Количество связей каждого пользователя одинаково во всех частях,
+    # часть обрабатывает только своих пользователей
+    def own_degrees(self, total):
+        counts = degrees(random.Random(self.shared_seed), self.activity, total)
+        return ((user, count) for user, count in counts.items() if user % self.jobs == self.job)
+
+    def follows(self):
+        rng = self.rng
+        limit = self.args.users // 2
+        for follower, count in self.own_degrees(self.args.follows):
+            for followee in distinct_targets(rng, self.popularity, min(count, limit), exclude=follower):
+                yield (self.user_id(follower), self.user_id(followee),
+                       self.clock.sample(rng).isoformat())
+
+    def post_reactions(self):
+        rng = self.rng
+        # Популярность постов: на одни посты реагируют намного чаще, чем на другие
+        posts = WeightedPicker(random.Random(self.shared_seed), self.args.posts)
+        limit = self.args.posts // 2
+        for user, count in self.own_degrees(self.args.reactions):
+            for post in distinct_targets(rng, posts, min(count, limit)):
+                reaction = "like" if rng.random() < self.args.like_share else "dislike"
+                yield (self.user_id(user), self.post_id(post), reaction)
+
+
+# Функция для загрузки одной части таблицы в отдельном процессе и соединении
+def copy_part(args, table, columns, job, jobs):
+    conn = connect()
+    try:
+        generator = Generator(args, job, jobs)
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+                               RowStream(getattr(generator, table)()), size=COPY_CHUNK)
+            count = cursor.rowcount
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+
+# Функция для загрузки таблицы через COPY в args.jobs параллельных процессов
+def copy_table(args, table, columns):
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.jobs) as pool:
+        count = sum(pool.starmap(copy_part, [(args, table, columns, job, args.jobs)
+                                             for job in range(args.jobs)]))
+    print(f"{table:<18} {count:>10} строк за {time.perf_counter() - started:6.1f} с")
+
+
+# Функция для подключения к базе данных
+def connect():
+    return psycopg2.connect(
+        user = DB_USER,
+        password = DB_PASS,
+        host = DB_HOST,
+        port = DB_PORT,
+        database = DB_NAME,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Генерация синтетических данных для нагрузочного тестирования "
+                    "(распределения Парето, всплески активности, загрузка через COPY)")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=5_000_000)
+    parser.add_argument("--follows", type=int, default=2_000_000)
+    parser.add_argument("--reactions", type=int, default=2_000_000, help="реакций на посты")
+    parser.add_argument("--message-reactions", type=float, default=0.1,
+                        help="доля сообщений с реакцией получателя")
+    parser.add_argument("--like-share", type=float, default=0.8, help="доля лайков среди реакций")
+    parser.add_argument("--deleted-share", type=float, default=0.02, help="доля удалённых сообщений")
+    parser.add_argument("--days", type=int, default=365, help="период, за который генерируются события")
+    parser.add_argument("--password", default="password", help="пароль всех пользователей")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора случайных чисел")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="параллельных процессов загрузки")
+    parser.add_argument("--truncate", action="store_true", help="очистить таблицы перед загрузкой")
+    args = parser.parse_args()
+    args.end = datetime.datetime.now().replace(microsecond=0)
+    args.start = args.end - datetime.timedelta(days=args.days)
+
+    conn = connect()
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        if args.truncate:
+            cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+        cursor.execute("SELECT count(*) FROM users")
+        if cursor.fetchone()[0]:
+            raise SystemExit(f"В БД {DB_NAME} уже есть пользователи: запустите с --truncate на отдельной БД")
+    conn.commit()
+
+    index_defs = drop_indexes(conn)
+    copy_table(args, "users", ("id", "username", "password_hash", "followers_count"))
+    execute(conn, "users_id_seq",
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))")
+    copy_table(args, "posts", ("id", "user_id", "post", "likes_count", "dislikes_count",
+                               "created_at", "edited_at"))
+    copy_table(args, "messages", ("id", "sender_id", "recipient_id", "message", "created_at",
+                                  "edited_at", "is_deleted", "likes_count", "dislikes_count"))
+    copy_table(args, "follows", ("follower_id", "followee_id", "created_at"))
+    copy_table(args, "post_reactions", ("user_id", "post_id", "reaction_type"))
+    # реакции получателей на часть неудалённых сообщений
+    execute(conn, "message_reactions", """
+        INSERT INTO message_reactions (user_id, message_id, reaction_type)
+        SELECT recipient_id, id, CASE WHEN random() < %(like_share)s THEN 'like' ELSE 'dislike' END
+        FROM messages
+        WHERE NOT is_deleted AND random() < %(share)s
+    """, {"like_share": args.like_share, "share": args.message_reactions})
+
+    # пересчёт счётчиков по загруженным связям
+    execute(conn, "followers_count", """
+        UPDATE users SET followers_count = f.n
+        FROM (SELECT followee_id, count(*) AS n FROM follows GROUP BY followee_id) f
+        WHERE users.id = f.followee_id
+    """)
+    for table, reactions, key in (("posts", "post_reactions", "post_id"),
+                                  ("messages", "message_reactions", "message_id")):
+        execute(conn, f"{table} counters", f"""
+            UPDATE {table} SET likes_count = r.likes, dislikes_count = r.dislikes
+            FROM (SELECT {key},
+                         count(*) FILTER (WHERE reaction_type = 'like') AS likes,
+                         count(*) FILTER (WHERE reaction_type = 'dislike') AS dislikes
+                  FROM {reactions} GROUP BY {key}) r
+            WHERE {table}.id = r.{key}
+        """)
+
+    # индекс постов автора нужен для заполнения лент
+    create_indexes(conn, index_defs)
+
+    # ленты: свои посты и последние посты авторов, на которых подписан пользователь,
+    # как после подписки (авторы с большим числом подписчиков подмешиваются при чтении)
+    execute(conn, "timelines", """
+        INSERT INTO timelines (user_id, created_at, post_id, author_id)
+        SELECT user_id, created_at, id, user_id FROM posts
+        UNION ALL
+        SELECT f.follower_id, p.created_at, p.id, p.user_id
+        FROM follows f
+        JOIN users a ON a.id = f.followee_id AND a.followers_count < %(fanout_limit)s
+        CROSS JOIN LATERAL (
+            SELECT id, created_at, user_id FROM posts
+            WHERE posts.user_id = f.followee_id
+            ORDER BY created_at DESC LIMIT %(backfill)s
+        ) p
+        ON CONFLICT DO NOTHING
+    """, {"fanout_limit": FEED_FANOUT_LIMIT, "backfill": FEED_BACKFILL_SIZE})
+
+    # беседы: последнее неудалённое сообщение каждой пары для обоих участников
+    execute(conn, "conversations", """
+        INSERT INTO conversations (user_id, peer_id, last_message_id, last_message, last_sender_id,
+                                   last_activity_at, unread_count, last_read_at)
+        SELECT DISTINCT ON (p.user_id, p.peer_id)
+               p.user_id, p.peer_id, m.id, left(m.message, %(preview)s), m.sender_id,
+               m.created_at, 0, m.created_at
+        FROM messages m
+        CROSS JOIN LATERAL (VALUES (m.sender_id, m.recipient_id),
+                                   (m.recipient_id, m.sender_id)) AS p (user_id, peer_id)
+        WHERE NOT m.is_deleted
+        ORDER BY p.user_id, p.peer_id, m.created_at DESC, m.id DESC
+    """, {"preview": CONVERSATION_PREVIEW_LENGTH})
+
+    # обновление статистики планировщика после загрузки
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("VACUUM ANALYZE")
+    conn.close()
+    print(f"Готово за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,3 +11,131 @@ DB_PASS = os.environ.get("DB_PASS")
 DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
+
+# Количество процессов-воркеров API (serve.py), по умолчанию по числу ядер
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", os.cpu_count() or 1))
+
+# Сколько соединений с сервером БД открывают все воркеры API вместе
+# (max_connections Postgres по умолчанию 100, остаток - миграциям, psql, мониторингу)
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", 80))
+
+# Функция для размеров пула одного воркера (постоянные соединения и сверх них):
+# по умолчанию доля DB_MAX_CONNECTIONS за вычетом соединения LISTEN брокера чата
+def pool_sizes(workers):
+    share = max(2, DB_MAX_CONNECTIONS // workers - 1)
+    pool_size = int(os.environ.get("DB_POOL_SIZE", max(1, min(10, share // 3))))
+    max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", max(0, min(20, share - pool_size))))
+    return pool_size, max_overflow
+
+# Настройки пула соединений с БД
+DB_POOL_SIZE, DB_MAX_OVERFLOW = pool_sizes(WEB_WORKERS)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Сколько запросов каждое соединение держит подготовленными на сервере (prepared statements),
+# 0 отключает кеш: запрос готовится заново при каждом выполнении
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_PREPARED_STATEMENT_CACHE_SIZE", 500))
+# Сколько соединений пула открывается при запуске воркера (прогрев), 0 - без прогрева
+DB_POOL_WARMUP = min(int(os.environ.get("DB_POOL_WARMUP", DB_POOL_SIZE)), DB_POOL_SIZE)
+
+# Реплика для чтения (GET-маршруты), та же БД и пользователь на другом сервере.
+# Если DB_REPLICA_HOST не задан, всё читается с основной БД
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.environ.get("DB_REPLICA_PORT", DB_PORT)
+# Сколько секунд после записи клиент самое большее читает с основной БД (read-your-writes),
+# обычно чтение возвращается на реплику раньше, как только она догонит запись
+READ_YOUR_WRITES_WINDOW = float(os.environ.get("READ_YOUR_WRITES_WINDOW", 5))
+# Как часто (в секундах) проверяется, догнала ли реплика основную БД
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 1))
+
+# Настройки хеширования паролей
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+# Настройки доставки событий чата по WebSocket
+# memory - в памяти одного воркера, postgres - LISTEN/NOTIFY для нескольких воркеров
+CHAT_BROKER = os.environ.get("CHAT_BROKER", "memory")
+CHAT_QUEUE_SIZE = int(os.environ.get("CHAT_QUEUE_SIZE", 100))
+# Как часто (в секундах) открытое WebSocket-соединение проверяет, что токен не истёк
+# и не отозван (набор отозванных токенов в памяти, без запроса к БД)
+CHAT_TOKEN_CHECK_INTERVAL = float(os.environ.get("CHAT_TOKEN_CHECK_INTERVAL", 5))
+
+# Максимальное количество сообщений в одном пакетном запросе
+CHAT_BATCH_MAX_SIZE = int(os.environ.get("CHAT_BATCH_MAX_SIZE", 1000))
+# На сколько строк разбита версия общих списков (посты, пользователи) для ETag,
+# чтобы параллельные изменения не ждали блокировку одной строки
+COLLECTION_VERSION_SHARDS = int(os.environ.get("COLLECTION_VERSION_SHARDS", 16))
+# Сколько символов последнего сообщения хранится в беседе для списка бесед
+CONVERSATION_PREVIEW_LENGTH = int(os.environ.get("CONVERSATION_PREVIEW_LENGTH", 100))
+
+# Настройки ленты: авторы с большим числом подписчиков не рассылают посты
+# по лентам (fan-out on write), их посты подмешиваются при чтении ленты
+FEED_FANOUT_LIMIT = int(os.environ.get("FEED_FANOUT_LIMIT", 10000))
+# Рассылка возобновляется, когда подписчиков становится меньше FEED_RESUME_LIMIT
+FEED_RESUME_LIMIT = int(os.environ.get("FEED_RESUME_LIMIT", FEED_FANOUT_LIMIT * 9 // 10))
+# Сколько последних постов автора добавляется в ленту при подписке
+# (и в ленты всех подписчиков при возобновлении рассылки)
+FEED_BACKFILL_SIZE = int(os.environ.get("FEED_BACKFILL_SIZE", 100))
+# Сколько подписчиков заполняется в одной транзакции при возобновлении рассылки
+FEED_BACKFILL_CHUNK = int(os.environ.get("FEED_BACKFILL_CHUNK", 100))
+# Интервал поиска авторов для возобновления рассылки в секундах
+FEED_RESUME_INTERVAL = float(os.environ.get("FEED_RESUME_INTERVAL", 60))
+
+# Сколько строк читается с сервера за раз при потоковой выдаче (NDJSON)
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 1000))
+
+# Контроль количества SQL-запросов на HTTP-запрос:
+# предупреждение в лог, если запросов больше QUERY_BUDGET
+QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", 10))
+# Строгий режим для тестов: ошибка, если один и тот же запрос
+# выполняется больше QUERY_REPEAT_LIMIT раз за HTTP-запрос (N+1)
+QUERY_STRICT = os.environ.get("QUERY_STRICT", "false").lower() in ("1", "true", "yes")
+QUERY_REPEAT_LIMIT = int(os.environ.get("QUERY_REPEAT_LIMIT", 1))
+
+# Время жизни токена доступа в минутах
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24))
+# Как часто (в секундах) каждый воркер перечитывает отозванные токены из БД
+TOKEN_REVOCATION_REFRESH = float(os.environ.get("TOKEN_REVOCATION_REFRESH", 5))
+# На сколько секунд назад от последнего прочитанного отзыва перечитываются токены:
+# отзыв с более ранним временем может зафиксироваться позже (больше самой долгой транзакции отзыва)
+TOKEN_REVOCATION_OVERLAP = float(os.environ.get("TOKEN_REVOCATION_OVERLAP", 60))
+
+# Ограничение нагрузки на маршруты записи (admission control)
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+# Хранилище лимитов пользователей: memory - в памяти одного воркера,
+# sqlite - общий файл для нескольких воркеров на одной машине
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH",
+                                 os.path.join(tempfile.gettempdir(), "social_network_rate_limits.db"))
+# Сколько запросов одного маршрута записи воркер обрабатывает одновременно
+# (по умолчанию половина пула БД, чтобы оставить соединения для чтения)
+WRITE_CONCURRENCY = int(os.environ.get("WRITE_CONCURRENCY", max(1, (DB_POOL_SIZE + DB_MAX_OVERFLOW) // 2)))
+# Скорость (запросов в секунду) и запас запросов записи одного пользователя
+WRITE_RATE = float(os.environ.get("WRITE_RATE", 5))
+WRITE_BURST = int(os.environ.get("WRITE_BURST", 20))
+# То же для входа и регистрации (по IP клиента): каждый запрос хеширует пароль
+AUTH_CONCURRENCY = int(os.environ.get("AUTH_CONCURRENCY", PASSWORD_HASH_WORKERS * 4))
+AUTH_RATE = float(os.environ.get("AUTH_RATE", 1))
+AUTH_BURST = int(os.environ.get("AUTH_BURST", 10))
+# Через сколько секунд повторить запрос, отклонённый из-за перегрузки (заголовок Retry-After)
+OVERLOAD_RETRY_AFTER = int(os.environ.get("OVERLOAD_RETRY_AFTER", 1))
+
+# Настройки запуска API в боевом режиме (serve.py)
+WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.environ.get("WEB_PORT", 5050))
+# Реализации event loop (uvloop, asyncio) и разбора HTTP (httptools, h11),
+# auto - самая быстрая из установленных
+WEB_LOOP = os.environ.get("WEB_LOOP", "auto")
+WEB_HTTP = os.environ.get("WEB_HTTP", "auto")
+# Сколько секунд держать простаивающее keep-alive соединение: дольше таймаута простоя
+# балансировщика (обычно 60 с), чтобы он не отправил запрос в закрытое воркером соединение
+WEB_KEEP_ALIVE = int(os.environ.get("WEB_KEEP_ALIVE", 65))
+# Очередь ещё не принятых соединений слушающего сокета
+WEB_BACKLOG = int(os.environ.get("WEB_BACKLOG", 2048))
+# Адреса прокси и балансировщиков через запятую, которым доверяется заголовок X-Forwarded-For:
+# для их запросов IP клиента (лимиты входа и регистрации по IP) берётся из заголовка.
+# Без этого за балансировщиком все клиенты получают один IP и делят один лимит
+WEB_FORWARDED_ALLOW_IPS = os.environ.get("WEB_FORWARDED_ALLOW_IPS", "127.0.0.1")
+# Сколько секунд после SIGTERM воркер ждёт завершения начатых запросов,
+# прежде чем прервать оставшиеся (долгие потоки NDJSON, WebSocket)
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
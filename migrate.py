@@ -0,0 +1,128 @@
+import argparse
+import os
+import re
+import psycopg2
+from config import DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME
+
+# Каталог с файлами миграций вида 0001_name.sql
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+# Метка для миграций, которые нельзя выполнять в транзакции
+# (например, CREATE INDEX CONCURRENTLY)
+NO_TRANSACTION_MARK = "-- migrate: no-transaction"
+# Ключ advisory-блокировки, чтобы миграции не запускались параллельно
+LOCK_KEY = 7_140_001
+
+# Функция для чтения списка миграций из каталога
+def load_migrations():
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as f:
+                migrations.append((int(match.group(1)), match.group(2), f.read()))
+    return sorted(migrations)
+
+# Функция для разбиения миграции на отдельные запросы.
+# Точка с запятой внутри тела в $$ ... $$ (DO-блоки, функции) запрос не завершает
+def split_statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    # части чередуются: текст запроса, затем разделитель ";" с пробелами до конца строки
+    parts = re.split(r"(;\s*$)", "\n".join(lines), flags=re.MULTILINE)
+    statements, pending = [], ""
+    for part, separator in zip(parts[0::2], parts[1::2] + [""]):
+        pending += part
+        if pending.count("$$") % 2 == 0:
+            statements.append(pending)
+            pending = ""
+        else:
+            # разделитель внутри тела в $$ остаётся в тексте без изменений
+            pending += separator
+    if pending:
+        statements.append(pending)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+# Функция для удаления невалидных индексов, оставшихся
+# от прерванного CREATE INDEX CONCURRENTLY
+def drop_invalid_indexes(cursor):
+    cursor.execute("""
+        SELECT quote_ident(c.relname) FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid AND n.nspname = current_schema()
+    """)
+    for (index_name,) in cursor.fetchall():
+        print(f"Удаление невалидного индекса {index_name}")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+# Функция для применения одной миграции
+def apply_migration(conn, version, name, sql):
+    cursor = conn.cursor()
+    if NO_TRANSACTION_MARK in sql:
+        # Каждый запрос выполняется отдельно, вне транзакции
+        conn.autocommit = True
+        drop_invalid_indexes(cursor)
+        for statement in split_statements(sql):
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                       (version, name))
+    else:
+        # Вся миграция выполняется в одной транзакции
+        conn.autocommit = False
+        cursor.execute(sql)
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                       (version, name))
+        conn.commit()
+    cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Применение миграций схемы БД")
+    parser.add_argument("--status", action="store_true",
+                        help="показать применённые и ожидающие миграции")
+    args = parser.parse_args()
+
+    # подключение к базе данных
+    conn = psycopg2.connect(
+        user = DB_USER,
+        password = DB_PASS,
+        host = DB_HOST,
+        port = DB_PORT,
+        database = DB_NAME,
+    )
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+    try:
+        # таблица с версиями применённых миграций
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {version for (version,) in cursor.fetchall()}
+
+        for version, name, sql in load_migrations():
+            if version in applied:
+                if args.status:
+                    print(f"[x] {version:04d}_{name}")
+                continue
+            if args.status:
+                print(f"[ ] {version:04d}_{name}")
+                continue
+            print(f"Применение миграции {version:04d}_{name}")
+            apply_migration(conn, version, name, sql)
+        if not args.status:
+            print("Схема БД в актуальном состоянии")
+    finally:
+        # снятие блокировки и закрытие соединения
+        conn.rollback()
+        conn.autocommit = True
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
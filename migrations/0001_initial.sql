@@ -0,0 +1,70 @@
+-- Исходная схема БД (бывший create_table.py)
+
+-- таблица "users"
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR UNIQUE,
+    password_hash VARCHAR
+);
+
+-- таблица "messages"
+CREATE TABLE IF NOT EXISTS messages (
+    id UUID DEFAULT uuid_generate_v4() UNIQUE PRIMARY KEY,
+    sender_id INTEGER,
+    recipient_id INTEGER,
+    message VARCHAR,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    edited_at VARCHAR NULL,
+    is_deleted BOOLEAN DEFAULT FALSE,
+    FOREIGN KEY (sender_id) REFERENCES users (id),
+    FOREIGN KEY (recipient_id) REFERENCES users (id)
+);
+
+-- таблица "tokens"
+CREATE TABLE IF NOT EXISTS tokens (
+    id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
+    token VARCHAR,
+    secret VARCHAR,
+    user_id INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- таблица "likes"
+CREATE TABLE IF NOT EXISTS likes (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    message_id UUID DEFAULT uuid_generate_v4(),
+    is_like BOOLEAN,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (message_id) REFERENCES messages (id)
+);
+
+-- таблица "dislikes"
+CREATE TABLE IF NOT EXISTS dislikes (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    message_id UUID DEFAULT uuid_generate_v4(),
+    is_dislike BOOLEAN,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (message_id) REFERENCES messages (id)
+);
+
+-- таблица "posts"
+CREATE TABLE IF NOT EXISTS posts (
+    id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
+    user_id INTEGER,
+    post TEXT,
+    likes_count INTEGER,
+    dislikes_count INTEGER,
+    created_at VARCHAR,
+    edited_at VARCHAR,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- таблица "post_reactions"
+CREATE TABLE IF NOT EXISTS post_reactions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    post_id UUID DEFAULT uuid_generate_v4() REFERENCES posts(id),
+    reaction_type VARCHAR
+);
@@ -0,0 +1,187 @@
+-- migrate: no-transaction
+-- Исправление типов колонок и единая таблица реакций на сообщения.
+-- Тип колонки меняется без перезаписи таблицы под блокировкой: рядом добавляется
+-- колонка нужного типа, её заполняет триггер (новые и изменённые строки) и пакеты
+-- по первичному ключу (существующие строки), затем колонки меняются местами
+-- одной короткой транзакцией. Остальные шаги - отдельные короткие транзакции
+
+-- даты постов и сообщений хранятся как TIMESTAMP, а не VARCHAR
+ALTER TABLE posts
+    ADD COLUMN IF NOT EXISTS created_at_new TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS edited_at_new TIMESTAMP,
+    ALTER COLUMN likes_count SET DEFAULT 0,
+    ALTER COLUMN dislikes_count SET DEFAULT 0;
+
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS edited_at_new TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION posts_timestamps_sync() RETURNS trigger AS $$
+BEGIN
+    NEW.created_at_new := NEW.created_at::timestamp;
+    NEW.edited_at_new := NEW.edited_at::timestamp;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION messages_timestamps_sync() RETURNS trigger AS $$
+BEGIN
+    NEW.edited_at_new := NEW.edited_at::timestamp;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posts_timestamps_sync ON posts;
+CREATE TRIGGER posts_timestamps_sync
+    BEFORE INSERT OR UPDATE ON posts
+    FOR EACH ROW EXECUTE FUNCTION posts_timestamps_sync();
+
+DROP TRIGGER IF EXISTS messages_timestamps_sync ON messages;
+CREATE TRIGGER messages_timestamps_sync
+    BEFORE INSERT OR UPDATE ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_timestamps_sync();
+
+-- заполнение существующих строк пакетами по 10000 в порядке первичного ключа
+-- с фиксацией после каждого пакета (у сообщений - только изменённые, остальные NULL)
+DO $$
+DECLARE
+    last_id uuid := '00000000-0000-0000-0000-000000000000';
+    batch_last_id uuid;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM posts WHERE id > last_id ORDER BY id LIMIT 10000
+        ), filled AS (
+            UPDATE posts p SET
+                created_at_new = p.created_at::timestamp,
+                edited_at_new = p.edited_at::timestamp
+            FROM batch WHERE p.id = batch.id
+        )
+        SELECT id INTO batch_last_id FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last_id IS NULL;
+        last_id := batch_last_id;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+DO $$
+DECLARE
+    last_id uuid := '00000000-0000-0000-0000-000000000000';
+    batch_last_id uuid;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM messages WHERE id > last_id ORDER BY id LIMIT 10000
+        ), filled AS (
+            UPDATE messages m SET edited_at_new = m.edited_at::timestamp
+            FROM batch WHERE m.id = batch.id AND m.edited_at IS NOT NULL
+        )
+        SELECT id INTO batch_last_id FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last_id IS NULL;
+        last_id := batch_last_id;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+-- замена колонок: только изменения каталога, блокировка на время транзакции.
+-- Если таблицу не удалось заблокировать за 5 секунд (долгий запрос), миграция
+-- завершается ошибкой и её можно запустить снова
+DO $$
+BEGIN
+    SET LOCAL lock_timeout = '5s';
+    DROP TRIGGER posts_timestamps_sync ON posts;
+    ALTER TABLE posts DROP COLUMN created_at;
+    ALTER TABLE posts DROP COLUMN edited_at;
+    ALTER TABLE posts RENAME COLUMN created_at_new TO created_at;
+    ALTER TABLE posts RENAME COLUMN edited_at_new TO edited_at;
+    ALTER TABLE posts ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP;
+END
+$$;
+
+DO $$
+BEGIN
+    SET LOCAL lock_timeout = '5s';
+    DROP TRIGGER messages_timestamps_sync ON messages;
+    ALTER TABLE messages DROP COLUMN edited_at;
+    ALTER TABLE messages RENAME COLUMN edited_at_new TO edited_at;
+END
+$$;
+
+DROP FUNCTION IF EXISTS posts_timestamps_sync();
+
+DROP FUNCTION IF EXISTS messages_timestamps_sync();
+
+-- удаление повторных реакций на посты перед созданием уникального индекса (0003)
+-- и пересчёт счётчиков постов по оставшимся реакциям (повторные реакции их завышали)
+-- в одной транзакции. Обновляются только строки с расхождением
+DO $$
+BEGIN
+    DELETE FROM post_reactions a USING post_reactions b
+    WHERE a.user_id = b.user_id AND a.post_id = b.post_id AND a.id < b.id;
+
+    UPDATE posts p SET
+        likes_count = coalesce(r.likes_count, 0),
+        dislikes_count = coalesce(r.dislikes_count, 0)
+    FROM posts p2
+    LEFT JOIN (
+        SELECT post_id,
+               count(*) FILTER (WHERE reaction_type = 'like') AS likes_count,
+               count(*) FILTER (WHERE reaction_type = 'dislike') AS dislikes_count
+        FROM post_reactions
+        GROUP BY post_id
+    ) r ON r.post_id = p2.id
+    WHERE p.id = p2.id
+      AND (p.likes_count, p.dislikes_count)
+          IS DISTINCT FROM (coalesce(r.likes_count, 0), coalesce(r.dislikes_count, 0));
+END
+$$;
+
+-- единая таблица реакций на сообщения
+CREATE TABLE IF NOT EXISTS message_reactions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    message_id UUID REFERENCES messages(id),
+    reaction_type VARCHAR,
+    CONSTRAINT uq_message_reactions_user_message UNIQUE (user_id, message_id)
+);
+
+-- счётчики реакций на сообщениях (значение по умолчанию - константа, без перезаписи таблицы)
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS likes_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS dislikes_count INTEGER NOT NULL DEFAULT 0;
+
+-- перенос реакций из "likes"/"dislikes" (если стояли обе, сохраняется лайк)
+-- и счётчики сообщений с реакциями в одной транзакции
+DO $$
+BEGIN
+    INSERT INTO message_reactions (user_id, message_id, reaction_type)
+    SELECT user_id, message_id, 'like' FROM likes WHERE is_like
+    ON CONFLICT (user_id, message_id) DO NOTHING;
+
+    INSERT INTO message_reactions (user_id, message_id, reaction_type)
+    SELECT user_id, message_id, 'dislike' FROM dislikes WHERE is_dislike
+    ON CONFLICT (user_id, message_id) DO NOTHING;
+
+    UPDATE messages m SET
+        likes_count = r.likes_count,
+        dislikes_count = r.dislikes_count
+    FROM (
+        SELECT message_id,
+               count(*) FILTER (WHERE reaction_type = 'like') AS likes_count,
+               count(*) FILTER (WHERE reaction_type = 'dislike') AS dislikes_count
+        FROM message_reactions
+        GROUP BY message_id
+    ) r
+    WHERE m.id = r.message_id;
+END
+$$;
+
+-- реакции на пост удаляются вместе с постом; ограничение добавляется без проверки
+-- строк, проверка идёт отдельной транзакцией и не блокирует запись в таблицы
+ALTER TABLE post_reactions
+    DROP CONSTRAINT IF EXISTS post_reactions_post_id_fkey,
+    ADD CONSTRAINT post_reactions_post_id_fkey
+        FOREIGN KEY (post_id) REFERENCES posts (id) ON DELETE CASCADE NOT VALID;
+
+ALTER TABLE post_reactions VALIDATE CONSTRAINT post_reactions_post_id_fkey;
@@ -0,0 +1,31 @@
+-- migrate: no-transaction
+-- Индексы для частых запросов, создаются без блокировки записи в таблицы
+
+-- постраничная выдача постов
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_created_at_id
+    ON posts (created_at, id);
+
+-- постраничная выдача входящих: частичный индекс только по неудалённым сообщениям
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_inbox_active
+    ON messages (recipient_id, created_at, id) WHERE is_deleted = false;
+DROP INDEX CONCURRENTLY IF EXISTS ix_messages_inbox;
+
+-- поиск сообщений по отправителю
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_sender_id
+    ON messages (sender_id);
+
+-- реакции на посты: уникальность для ON CONFLICT и поиск по посту
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_post_reactions_user_post
+    ON post_reactions (user_id, post_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_post_reactions_post_id
+    ON post_reactions (post_id);
+
+-- реакции на сообщения: поиск по сообщению
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_message_reactions_message_id
+    ON message_reactions (message_id);
+
+-- токены: поиск по значению токена и по пользователю
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tokens_token
+    ON tokens (token);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tokens_user_id
+    ON tokens (user_id);
@@ -0,0 +1,29 @@
+-- Подписки между пользователями и материализованные ленты постов
+
+-- количество подписчиков (для выбора fan-out on write / on read)
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS followers_count INTEGER NOT NULL DEFAULT 0;
+
+-- таблица подписок "follows"
+CREATE TABLE IF NOT EXISTS follows (
+    follower_id INTEGER NOT NULL REFERENCES users (id),
+    followee_id INTEGER NOT NULL REFERENCES users (id),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (follower_id, followee_id)
+);
+CREATE INDEX IF NOT EXISTS ix_follows_followee_id
+    ON follows (followee_id, follower_id);
+
+-- таблица лент "timelines": одна строка на пост в ленте пользователя,
+-- лента читается одним диапазоном по первичному ключу
+CREATE TABLE IF NOT EXISTS timelines (
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    post_id UUID NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+    author_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, created_at, post_id)
+);
+CREATE INDEX IF NOT EXISTS ix_timelines_post_id
+    ON timelines (post_id);
+CREATE INDEX IF NOT EXISTS ix_timelines_user_author
+    ON timelines (user_id, author_id);
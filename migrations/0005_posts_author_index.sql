@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Посты автора по времени: fan-out on read и заполнение ленты при подписке
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_user_id_created_at
+    ON posts (user_id, created_at, id);
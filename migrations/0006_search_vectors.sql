@@ -0,0 +1,76 @@
+-- migrate: no-transaction
+-- Поисковые векторы для полнотекстового поиска по постам и сообщениям.
+-- Столбец добавляется без значения по умолчанию (без перезаписи таблицы и долгой блокировки),
+-- новые и изменённые строки заполняет триггер, поэтому вставка, пакетная вставка
+-- и редактирование не требуют изменений в коде. Существующие строки заполняются пакетами
+-- с фиксацией после каждого пакета, индексы строятся в 0007 (CONCURRENTLY)
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION posts_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('simple', coalesce(NEW.post, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION messages_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('simple', coalesce(NEW.message, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+-- вектор пересчитывается только при изменении текста, а не счётчиков реакций
+DROP TRIGGER IF EXISTS posts_search_vector ON posts;
+CREATE TRIGGER posts_search_vector
+    BEFORE INSERT OR UPDATE OF post ON posts
+    FOR EACH ROW EXECUTE FUNCTION posts_search_vector_update();
+
+DROP TRIGGER IF EXISTS messages_search_vector ON messages;
+CREATE TRIGGER messages_search_vector
+    BEFORE INSERT OR UPDATE OF message ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update();
+
+-- заполнение существующих строк пакетами по 10000 в порядке первичного ключа,
+-- блокировки строк держатся только до конца пакета
+DO $$
+DECLARE
+    last_id uuid := '00000000-0000-0000-0000-000000000000';
+    batch_last_id uuid;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM posts WHERE id > last_id ORDER BY id LIMIT 10000
+        ), filled AS (
+            UPDATE posts p SET search_vector = to_tsvector('simple', coalesce(p.post, ''))
+            FROM batch WHERE p.id = batch.id AND p.search_vector IS NULL
+        )
+        SELECT id INTO batch_last_id FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last_id IS NULL;
+        last_id := batch_last_id;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+DO $$
+DECLARE
+    last_id uuid := '00000000-0000-0000-0000-000000000000';
+    batch_last_id uuid;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM messages WHERE id > last_id ORDER BY id LIMIT 10000
+        ), filled AS (
+            UPDATE messages m SET search_vector = to_tsvector('simple', coalesce(m.message, ''))
+            FROM batch WHERE m.id = batch.id AND m.search_vector IS NULL
+        )
+        SELECT id INTO batch_last_id FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last_id IS NULL;
+        last_id := batch_last_id;
+        COMMIT;
+    END LOOP;
+END
+$$;
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- GIN-индексы для полнотекстового поиска
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_search_vector
+    ON posts USING gin (search_vector);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_search_vector
+    ON messages USING gin (search_vector);
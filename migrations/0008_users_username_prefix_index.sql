@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Поиск пользователей по началу имени без учёта регистра (подсказки при вводе)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_prefix
+    ON users (lower(username) text_pattern_ops);
@@ -0,0 +1,14 @@
+-- Токены с id (jti) и сроком действия: запись в tokens на каждый выданный токен,
+-- отозванные токены (выход) помечаются revoked_at
+
+ALTER TABLE tokens
+    ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS revoked_at TIMESTAMP;
+
+-- старые токены без jti и срока действия больше не принимаются:
+-- все сессии, открытые до миграции, завершаются, пользователи входят заново
+DELETE FROM tokens WHERE expires_at IS NULL;
+
+-- чтение отозванных токенов воркерами
+CREATE INDEX IF NOT EXISTS ix_tokens_revoked_at
+    ON tokens (revoked_at) WHERE revoked_at IS NOT NULL;
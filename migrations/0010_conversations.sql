@@ -0,0 +1,33 @@
+-- Беседы: по одной строке на каждого участника переписки с последним сообщением
+-- и числом непрочитанных. Обновляются в той же транзакции, что и сообщения
+
+-- таблица бесед "conversations"
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    peer_id INTEGER NOT NULL REFERENCES users (id),
+    last_message_id UUID,
+    last_message VARCHAR,
+    last_sender_id INTEGER,
+    last_activity_at TIMESTAMP NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_read_at TIMESTAMP,
+    PRIMARY KEY (user_id, peer_id)
+);
+-- список бесед пользователя по последней активности
+CREATE INDEX IF NOT EXISTS ix_conversations_user_activity
+    ON conversations (user_id, last_activity_at, peer_id);
+
+-- заполнение бесед по уже отправленным сообщениям: последнее неудалённое сообщение
+-- каждой пары для обоих участников, прежние сообщения считаются прочитанными
+INSERT INTO conversations (user_id, peer_id, last_message_id, last_message, last_sender_id,
+                           last_activity_at, unread_count, last_read_at)
+SELECT DISTINCT ON (p.user_id, p.peer_id)
+       p.user_id, p.peer_id, m.id, left(m.message, 100), m.sender_id,
+       m.created_at, 0, m.created_at
+FROM messages m
+CROSS JOIN LATERAL (VALUES (m.sender_id, m.recipient_id),
+                           (m.recipient_id, m.sender_id)) AS p (user_id, peer_id)
+WHERE NOT m.is_deleted
+  AND m.sender_id IS NOT NULL AND m.recipient_id IS NOT NULL AND m.created_at IS NOT NULL
+ORDER BY p.user_id, p.peer_id, m.created_at DESC, m.id DESC
+ON CONFLICT DO NOTHING;
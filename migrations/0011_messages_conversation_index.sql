@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- История переписки двух пользователей в обе стороны: пара (меньший id, больший id)
+-- и время, только по неудалённым сообщениям
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_conversation
+    ON messages (least(sender_id, recipient_id), greatest(sender_id, recipient_id), created_at, id)
+    WHERE is_deleted = false;
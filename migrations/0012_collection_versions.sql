@@ -0,0 +1,9 @@
+-- Версии списков для ETag и условных GET-запросов: версия растёт в той же транзакции,
+-- что и изменение списка, и проверяется одним запросом по первичному ключу
+
+-- таблица версий "collection_versions"
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name VARCHAR PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
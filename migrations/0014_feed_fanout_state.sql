@@ -0,0 +1,11 @@
+-- migrate: no-transaction
+-- Состояние рассылки постов автора по лентам: fanout_paused - новые посты не рассылаются,
+-- feed_merged - посты автора подмешиваются в ленты при чтении. Столбцы со значением
+-- по умолчанию-константой добавляются без перезаписи таблицы
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS fanout_paused BOOLEAN NOT NULL DEFAULT false,
+    ADD COLUMN IF NOT EXISTS feed_merged BOOLEAN NOT NULL DEFAULT false;
+
+-- авторы, для которых рассылку нужно возобновить, ищутся по частичному индексу
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_feed_merged
+    ON users (id) WHERE feed_merged;
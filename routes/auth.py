@@ -1,48 +1,52 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from scheme.models import User, UserAuth, Token
-from passlib.hash import bcrypt
-from fastapi.security import OAuth2PasswordRequestForm
-from utils.jwt import create_access_token
-from utils.sqlalchemy import SessionLocal
-import uuid
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from utils.jwt import create_access_token, validate_token, revoked_tokens
+from utils.errors import unauthorized
+from utils.limits import auth_admission
+from utils.etags import USERS_COLLECTION, bump_versions
+from utils.passwords import hash_password, verify_password
+from utils.sqlalchemy import get_db
+from utils.statements import USER_BY_USERNAME, REVOKE_TOKEN
 import secrets
 
 router = APIRouter(
     tags=["Auth"],
     prefix="/auth"
 )
+# Схема аутентификации
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/signin")
 
-@router.post("/signup")
-async def create_user(user: UserAuth):
+@router.post("/signup", dependencies=[auth_admission("signup")])
+async def create_user(user: UserAuth, db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для регистрации нового пользователя
 
     - **username**: Username of the user (string)
     - **password**: Password of the user (string)
     """
-    # Создание сессии БД
-    db = SessionLocal()
     # Проверка на совпадение имени пользователя с существующими
-    check_username = db.query(User).filter(User.username == user.username).first()
+    check_username = await db.scalar(USER_BY_USERNAME, {"username": user.username})
     if check_username is not None:
-        db.close()
         return {"detail":"Пользователь с таким именем уже существует"}
     
-    # Хеширование пароля перед сохранением в БД
-    password_hash = bcrypt.hash(user.password)
+    # Хеширование пароля перед сохранением в БД (в пуле потоков)
+    password_hash = await hash_password(user.password)
     # Создание новой записи пользователя
     db_user = User(username=user.username, password_hash=password_hash)
     # Добавление пользователя в сессию БД
     db.add(db_user)
+    # Новая версия списка пользователей
+    await bump_versions(db, USERS_COLLECTION)
     # Фиксация изменений в БД
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
     return {"detail": "Пользователь создан", "username": user.username} 
 
 # Маршрут для проверки логина и пароля пользователя
-@router.post("/signin")
-async def login_user(user_auth: OAuth2PasswordRequestForm = Depends()):
+@router.post("/signin", dependencies=[auth_admission("signin")])
+async def login_user(user_auth: OAuth2PasswordRequestForm = Depends(),
+                     db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для авторизации пользователя, 
     # и получения токена
@@ -50,49 +54,61 @@ async def login_user(user_auth: OAuth2PasswordRequestForm = Depends()):
     - **username**: Username of the user (string)
     - **password**: Password of the user (string)
     """
-    # Создание сессии БД
-    db = SessionLocal()
-    try:
-        # Проверка наличия пользователя с таким именем в БД
-        db_user = db.query(User).filter(User.username == user_auth.username).first()
-        if db_user is None:
-            return {"detail": "Пользователь не найден"}
-        if bcrypt.verify(user_auth.password, db_user.password_hash):
-            # Генерация нового токена доступа
-            access_token = create_access_token(user_auth.username)
-            
-            # Проверка наличия существующего токена для пользователя
-            existing_token = db.query(Token).filter(Token.user_id == db_user.id).first()
-            if existing_token:
-                # Обновление существующий токен
-                existing_token = access_token.decode()
-                # Фиксация изменений в БД
-                db.commit()
-            else:
-                # Создание новой записи токена
-                token_secret = secrets.token_urlsafe(16)
-                token_id = str(uuid.uuid4())
-                db_token = Token(id=token_id,
-                                 token=access_token.decode(),
-                                 secret=token_secret,
-                                 user_id=db_user.id)
-                # Добавление токена в сессию БД
-                db.add(db_token)
-                # Фиксация изменений в БД
-                db.commit()
-            
-            # Обновление экземпляра db_user, чтобы привязать его к сессии
-            db.refresh(db_user)
-            
-            # Возвращаем логин, токен и статус успешной проверки логина и пароля
-            return {"detail": "Успешный вход",
-                    "username": user_auth.username,
-                    "id": db_user.id,
-                    "access_token": access_token,
-                    "token_type": "bearer"}
-        else:
-            # В случае неудачной проверки логина и пароля возвращаем ошибку
-            return {"detail": "Неверный пароль"} if db_user else {"detail": "Пользователь не найден"}
-    finally:
-        # Закрытие сессии БД
-        db.close()
\ No newline at end of file
+    # Проверка наличия пользователя с таким именем в БД
+    db_user = await db.scalar(USER_BY_USERNAME, {"username": user_auth.username})
+    if db_user is None:
+        return {"detail": "Пользователь не найден"}
+    # Проверка пароля (в пуле потоков)
+    password_ok, new_password_hash = await verify_password(user_auth.password, db_user.password_hash)
+    if password_ok:
+        # Перехеширование пароля, если изменилась стоимость bcrypt
+        if new_password_hash:
+            db_user.password_hash = new_password_hash
+
+        # Генерация нового токена доступа с id пользователя, сроком действия и jti
+        access_token, token_id, expires_at = create_access_token(db_user.id, user_auth.username)
+
+        # Создание записи токена: одна запись на каждый выданный токен,
+        # по ней токен можно отозвать при выходе
+        token_secret = secrets.token_urlsafe(16)
+        db_token = Token(id=token_id,
+                         token=access_token,
+                         secret=token_secret,
+                         user_id=db_user.id,
+                         expires_at=expires_at)
+        # Добавление токена в сессию БД
+        db.add(db_token)
+        # Фиксация изменений в БД
+        await db.commit()
+
+        # Возвращаем логин, токен и статус успешной проверки логина и пароля
+        return {"detail": "Успешный вход",
+                "username": user_auth.username,
+                "id": db_user.id,
+                "access_token": access_token,
+                "token_type": "bearer"}
+    else:
+        # В случае неудачной проверки логина и пароля возвращаем ошибку
+        return {"detail": "Неверный пароль"}
+
+@router.post("/signout")
+async def logout_user(token: str = Depends(oauth2_scheme),
+                      db: AsyncSession = Depends(get_db)):
+    """
+    # Маршрут для выхода: токен отзывается и больше не принимается
+    """
+    # Проверка валидности токена
+    payload = validate_token(token)
+    if payload is None:
+        unauthorized("Упс! Вам нужно авторизироваться")
+
+    # Пометка токена отозванным одним запросом
+    db_token = (await db.execute(REVOKE_TOKEN, {"jti": payload["jti"]})).first()
+    if db_token is not None:
+        # Фиксация изменений в БД
+        await db.commit()
+        # Остальные воркеры узнают об отзыве при следующем обновлении списка
+        revoked_tokens.add(db_token.id, db_token.expires_at)
+
+    # Возвращаем статус успешного выхода
+    return {"detail": "Вы вышли из аккаунта"}
@@ -1,11 +1,27 @@
-from fastapi import APIRouter, Depends
-from utils.jwt import validate_token
-from utils.sqlalchemy import SessionLocal
-from utils.errors import unauthorized, forbidden, not_found
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Query, Request
+from utils.responses import ORJSONResponse
+from sqlalchemy import select, insert, tuple_, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.jwt import token_user_id
+from utils.sqlalchemy import get_db
+from utils.statements import EXISTING_USERS, OWN_MESSAGE
+from utils.replicas import get_read_db
+from utils.broker import broker
+from utils.limits import write_admission
+from utils.etags import inbox_collection, collection_version, not_modified, bump_versions
+from utils.errors import bad_request, forbidden, not_found
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, encode_rank_cursor
+from utils.search import ranked_search
+from utils.conversations import (conversation_filter, record_sent_messages, record_edited_message,
+                                 record_deleted_message, mark_read)
 from fastapi.security import OAuth2PasswordBearer
-from scheme.models import User, Message, MessageSend, MessageUpdate, Token, Like, Dislike
+from scheme.models import (User, Message, MessageReaction, MessageSend, MessageUpdate, Conversation,
+                           MESSAGE_COLUMNS, CONVERSATION_COLUMNS, InboxPage, MessageSearchPage,
+                           MessagePage, ConversationPage)
 import uuid
 import datetime
+from config import CHAT_BATCH_MAX_SIZE
 
 router = APIRouter(
     tags=["Messages"],
@@ -14,26 +30,21 @@ router = APIRouter(
 # Схема аутентификации
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/signin")
 
-@router.post("/messages")
-async def create_message(message: MessageSend, token: str = Depends(oauth2_scheme)):
+# Имена столбцов сообщения в строке выборки MESSAGE_COLUMNS
+MESSAGE_FIELDS = tuple(column.key for column in MESSAGE_COLUMNS)
+
+# Функция для получения словаря сообщения из строки выборки
+def message_fields(row):
+    return {field: row[index] for index, field in enumerate(MESSAGE_FIELDS)}
+
+@router.post("/messages", dependencies=[write_admission("create_message")])
+async def create_message(message: MessageSend, token: str = Depends(oauth2_scheme),
+                         db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для отправки сообщения пользователю по user id
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-    
-    # Создание сессии БД
-    db = SessionLocal()
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
-    
-    # Получение идентификатора пользователя из токена
-    sender_id = allow_token.user_id
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    sender_id = token_user_id(token)
 
     # Генерация уникального идентификатора сообщения
     msg_id = str(uuid.uuid4())
@@ -41,16 +52,33 @@ async def create_message(message: MessageSend, token: str = Depends(oauth2_schem
     time_now = datetime.datetime.now()
     # Создание объекта сообщения для сохранения в БД
     db_message = Message(id=msg_id,
-                        sender_id=int(sender_id), 
-                        recipient_id=int(message.recipient_id), 
+                        sender_id=int(sender_id),
+                        recipient_id=int(message.recipient_id),
                         message=str(message.message),
-                        created_at=str(time_now))
+                        created_at=time_now)
     # Добавление сообщения в сессию БД
     db.add(db_message)
+    await db.flush()
+    # Обновление беседы отправителя и получателя в той же транзакции
+    await record_sent_messages(db, [{
+        "id": db_message.id,
+        "sender_id": db_message.sender_id,
+        "recipient_id": db_message.recipient_id,
+        "message": db_message.message,
+        "created_at": time_now
+    }])
+    # Новая версия входящих получателя
+    await bump_versions(db, inbox_collection(db_message.recipient_id))
     # Фиксация изменений в БД
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
+    # Уведомление получателя о новом сообщении
+    await broker.publish(db_message.recipient_id, "message.created", {
+        "id": msg_id,
+        "sender_id": sender_id,
+        "recipient_id": message.recipient_id,
+        "message": message.message,
+        "created_at": time_now
+    })
     # Возвращаем статус успешной отправки сообщения и все данные о сообщении
     return {
         "detail": "Сообщение отправлено!",
@@ -62,106 +90,325 @@ async def create_message(message: MessageSend, token: str = Depends(oauth2_schem
     }
 
 
-@router.get("/messages/{recipient_id}")
-async def get_user_messages(recipient_id: int, token: str = Depends(oauth2_scheme)):
+@router.post("/messages/batch", dependencies=[write_admission("create_messages_batch")])
+async def create_messages_batch(batch: List[MessageSend], token: str = Depends(oauth2_scheme),
+                                db: AsyncSession = Depends(get_db)):
     """
-    # Маршрут для получения всех входящий сообщений по user id
+    # Маршрут для пакетной отправки сообщений одним запросом
+
+    Все корректные сообщения записываются одной транзакцией,
+    для каждого элемента возвращается id или текст ошибки
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    sender_id = token_user_id(token)
 
-    # Создание сессии БД
-    db = SessionLocal()
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
+    # Проверка размера пакета
+    if not batch or len(batch) > CHAT_BATCH_MAX_SIZE:
+        bad_request(f"В пакете должно быть от 1 до {CHAT_BATCH_MAX_SIZE} сообщений")
 
-    # Получение идентификатора пользователя из токена
-    user_id = allow_token.user_id
+    # Проверка всех получателей одним запросом
+    recipient_ids = {item.recipient_id for item in batch}
+    existing_ids = set((await db.scalars(EXISTING_USERS, {"user_ids": list(recipient_ids)})).all())
 
-    # Запрет на чтение чужих сообщений
-    if user_id != recipient_id:
-        db.close()
-        forbidden("Вы можете читать только свои сообщения :)")
+    # Подготовка строк для вставки и результатов по каждому элементу
+    time_now = datetime.datetime.now()
+    rows = []
+    results = []
+    for index, item in enumerate(batch):
+        if item.recipient_id not in existing_ids:
+            results.append({"index": index, "error": "Получатель не найден"})
+        elif not item.message:
+            results.append({"index": index, "error": "Пустое сообщение"})
+        else:
+            msg_id = uuid.uuid4()
+            rows.append({
+                "id": msg_id,
+                "sender_id": sender_id,
+                "recipient_id": item.recipient_id,
+                "message": item.message,
+                "created_at": time_now,
+                "is_deleted": False,
+                "likes_count": 0,
+                "dislikes_count": 0,
+            })
+            results.append({"index": index, "id": msg_id})
+
+    if rows:
+        # Запись всех сообщений многострочным INSERT в одной транзакции
+        await db.execute(insert(Message.__table__), rows)
+        # Обновление бесед всех получателей в той же транзакции
+        await record_sent_messages(db, rows)
+        # Новые версии входящих всех получателей
+        await bump_versions(db, *(inbox_collection(row["recipient_id"]) for row in rows))
+        # Фиксация изменений в БД
+        await db.commit()
+        # Уведомление получателей о новых сообщениях (все события одной публикацией)
+        await broker.publish_many([
+            (row["recipient_id"], "message.created", {
+                "id": row["id"],
+                "sender_id": sender_id,
+                "recipient_id": row["recipient_id"],
+                "message": row["message"],
+                "created_at": time_now
+            })
+            for row in rows
+        ])
+
+    # Возвращаем результаты по каждому сообщению пакета
+    return {
+        "detail": f"Отправлено сообщений: {len(rows)} из {len(batch)}",
+        "results": results
+    }
 
-    # Получение всех сообщений для указанного получателя, включая проверку is_deleted
-    messages = db.query(Message).filter(
-        Message.recipient_id == recipient_id,
-        Message.is_deleted == False
-    ).all()
 
-    # Получение уникальных идентификаторов отправителей
-    sender_ids = list(set([message.sender_id for message in messages]))
+@router.get("/messages/{recipient_id}", response_model=InboxPage)
+async def get_user_messages(request: Request,
+                            recipient_id: int,
+                            limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None,
+                            token: str = Depends(oauth2_scheme),
+                            db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для постраничного получения входящих сообщений по user id
+    # (сначала новые)
 
-    # Получение информации об отправителях сообщений
-    senders = db.query(User).filter(User.id.in_(sender_ids)).all()
+    - **limit**: количество сообщений на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
 
-    # Получение информации о лайках и дислайках для каждого сообщения
-    likes = db.query(Like).filter(Like.message_id.in_([message.id for message in messages])).all()
-    dislikes = db.query(Dislike).filter(Dislike.message_id.in_([message.id for message in messages])).all()
+    # Запрет на чтение чужих сообщений
+    if user_id != recipient_id:
+        forbidden("Вы можете читать только свои сообщения :)")
 
-    # Закрытие сессии БД
-    db.close()
+    # Проверка версии входящих: если у клиента она актуальна, ответ 304 без запроса сообщений
+    version = await collection_version(db, inbox_collection(recipient_id))
+    response = not_modified(request, version)
+    if response:
+        return response
 
-    # Создание словарей для хранения информации о лайках и дислайках по идентификаторам сообщений
-    likes_by_message = {like.message_id: like.is_like for like in likes}
-    dislikes_by_message = {dislike.message_id: dislike.is_dislike for dislike in dislikes}
+    # Получение одной страницы сообщений для указанного получателя, включая проверку is_deleted,
+    # по частичному индексу (recipient_id, created_at, id) WHERE is_deleted = false.
+    # Имя отправителя и собственная реакция получателя берутся тем же запросом,
+    # выбираются только нужные столбцы, без создания ORM-объектов
+    query = (
+        select(*MESSAGE_COLUMNS, User.username, MessageReaction.reaction_type)
+        .outerjoin(User, User.id == Message.sender_id)
+        .outerjoin(MessageReaction, and_(
+            MessageReaction.message_id == Message.id,
+            MessageReaction.user_id == recipient_id
+        ))
+        .where(Message.recipient_id == recipient_id, Message.is_deleted == False)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        # Продолжение выдачи после последнего сообщения предыдущей страницы
+        created_at, message_id = decode_cursor(cursor)
+        query = query.where(tuple_(Message.created_at, Message.id) < (created_at, message_id))
+    rows = (await db.execute(query)).all()
 
-    # Создание словаря для хранения имен отправителей по их идентификаторам
-    sender_names = {sender.id: sender.username for sender in senders}
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
 
     # Формирование списка полученных сообщений
     received_messages = []
-    for message in messages:
-        sender_name = sender_names.get(message.sender_id)
+    for row in rows:
         received_messages.append(
             {
-                "message": message,
-                "username": sender_name,
-                "is_liked": likes_by_message.get(message.id),
-                "is_disliked": dislikes_by_message.get(message.id),
+                "message": message_fields(row),
+                "username": row.username,
+                "likes_count": row.likes_count,
+                "dislikes_count": row.dislikes_count,
+                "is_liked": True if row.reaction_type == "like" else None,
+                "is_disliked": True if row.reaction_type == "dislike" else None,
             }
         )
 
-    # Возвращаем все полученные сообщения
-    return received_messages
+    # Возвращаем страницу полученных сообщений и курсор следующей страницы с версией входящих (ETag),
+    # ответ сериализуется orjson за один проход
+    return ORJSONResponse({"messages": received_messages, "next_cursor": next_cursor},
+                          headers=version.headers)
+
 
 
+@router.get("/conversations", response_model=ConversationPage)
+async def get_conversations(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None,
+                            token: str = Depends(oauth2_scheme),
+                            db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для постраничного получения списка бесед
+    # (сначала с последней активностью)
+
+    - **limit**: количество бесед на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Получение одной страницы бесед по индексу (user_id, last_activity_at, peer_id).
+    # Имя собеседника берётся тем же запросом
+    query = (
+        select(*CONVERSATION_COLUMNS, User.username)
+        .outerjoin(User, User.id == Conversation.peer_id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.last_activity_at.desc(), Conversation.peer_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        # Продолжение выдачи после последней беседы предыдущей страницы
+        last_activity_at, peer_id = decode_cursor(cursor, int)
+        query = query.where(tuple_(Conversation.last_activity_at, Conversation.peer_id)
+                            < (last_activity_at, peer_id))
+    rows = (await db.execute(query)).all()
 
-@router.put("/messages/{message_id}")
-async def update_message(message_id: str, data: MessageUpdate, token: str = Depends(oauth2_scheme)):
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].last_activity_at, rows[-1].peer_id)
+
+    # Возвращаем страницу бесед и курсор следующей страницы
+    return ORJSONResponse({"conversations": [row._asdict() for row in rows], "next_cursor": next_cursor})
+
+
+@router.get("/conversations/{peer_id}", response_model=MessagePage)
+async def get_conversation_history(peer_id: int,
+                                   limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                   cursor: Optional[str] = None,
+                                   direction: Literal["older", "newer"] = "older",
+                                   token: str = Depends(oauth2_scheme),
+                                   db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для постраничного получения истории переписки с пользователем,
+    # входящие и отправленные сообщения вместе
+
+    **удалённые сообщения в историю не попадают**
+
+    - **limit**: количество сообщений на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    - **direction**: `older` - от новых к старым (по умолчанию),
+      `newer` - от старых к новым, например, с курсора последнего прочитанного сообщения
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Получение одной страницы переписки по индексу ix_messages_conversation
+    # в выбранном направлении
+    query = select(*MESSAGE_COLUMNS).where(*conversation_filter(user_id, peer_id))
+    position = tuple_(Message.created_at, Message.id)
+    if direction == "older":
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.created_at, Message.id)
+    if cursor:
+        # Продолжение выдачи после последнего сообщения предыдущей страницы
+        created_at, message_id = decode_cursor(cursor)
+        if direction == "older":
+            query = query.where(position < (created_at, message_id))
+        else:
+            query = query.where(position > (created_at, message_id))
+    rows = (await db.execute(query.limit(limit + 1))).all()
+
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    # Возвращаем страницу переписки и курсор следующей страницы
+    return ORJSONResponse({"messages": [message_fields(row) for row in rows], "next_cursor": next_cursor})
+
+
+@router.post("/conversations/{peer_id}/read", dependencies=[write_admission("read_conversation")])
+async def read_conversation(peer_id: int, token: str = Depends(oauth2_scheme),
+                            db: AsyncSession = Depends(get_db)):
+    """
+    # Маршрут для отметки всех сообщений беседы прочитанными
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Обнуление счётчика непрочитанных
+    if not await mark_read(db, user_id, peer_id, datetime.datetime.now()):
+        not_found("Беседа не найдена")
+    # Фиксация изменений в БД
+    await db.commit()
+    # Возвращаем статус успешной отметки
+    return {"detail": "Беседа отмечена прочитанной"}
+
+
+@router.get("/search", response_model=MessageSearchPage)
+async def search_messages(q: str,
+                          limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          cursor: Optional[str] = None,
+                          token: str = Depends(oauth2_scheme),
+                          db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для полнотекстового поиска по своим сообщениям,
+    # входящим и отправленным (сначала самые релевантные)
+
+    **удалённые сообщения в поиск не попадают**
+
+    - **q**: поисковый запрос: слова, "точная фраза", -исключение, or
+    - **limit**: количество сообщений на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Поиск только среди неудалённых сообщений, где пользователь отправитель или получатель.
+    # Имя отправителя берётся тем же запросом
+    query = (
+        select(*MESSAGE_COLUMNS, User.username)
+        .outerjoin(User, User.id == Message.sender_id)
+        .where(or_(Message.recipient_id == user_id, Message.sender_id == user_id),
+               Message.is_deleted == False)
+    )
+    query = ranked_search(query, Message.search_vector, Message.id, q, limit, cursor)
+    rows = (await db.execute(query)).all()
+
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1].rank, rows[-1].id)
+
+    # Формирование списка найденных сообщений
+    found_messages = []
+    for row in rows:
+        found_messages.append(
+            {
+                "message": message_fields(row),
+                "username": row.username,
+                "rank": row.rank,
+            }
+        )
+
+    # Возвращаем страницу найденных сообщений и курсор следующей страницы
+    return ORJSONResponse({"messages": found_messages, "next_cursor": next_cursor})
+
+
+
+@router.put("/messages/{message_id}", dependencies=[write_admission("update_message")])
+async def update_message(message_id: str, data: MessageUpdate, token: str = Depends(oauth2_scheme),
+                         db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для изменения своих сообщений по message id
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-    
-    # Создание сессии БД
-    db = SessionLocal()
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
-    
-    # Получение идентификатора пользователя из токена
-    sender_id = allow_token.user_id
-    
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    sender_id = token_user_id(token)
+
     # Поиск сообщения в БД, включая проверку is_deleted
-    db_message = db.query(Message).filter(
-        Message.id == message_id,
-        Message.sender_id == sender_id,
-        Message.is_deleted == False
-    ).first()
+    db_message = await db.scalar(OWN_MESSAGE, {"message_id": message_id, "sender_id": sender_id})
     if not db_message:
-        db.close()
         not_found("Сообщение не найдено")
-    
+
     # Запись обновлённого сообщения
     updated_message = data.message
     if updated_message:
@@ -169,49 +416,45 @@ async def update_message(message_id: str, data: MessageUpdate, token: str = Depe
         db_message.message = updated_message
         # Получение текущего времени
         db_message.edited_at = datetime.datetime.now()
+        # Обновление текста последнего сообщения беседы, если изменено оно
+        await record_edited_message(db, db_message)
+        # Новая версия входящих получателя
+        await bump_versions(db, inbox_collection(db_message.recipient_id))
         # Фиксация изменений в БД
-        db.commit()
-    # Закрытие сессии БД
-    db.close()
+        await db.commit()
+        # Уведомление получателя об изменении сообщения
+        await broker.publish(db_message.recipient_id, "message.updated", {
+            "id": message_id,
+            "message": db_message.message,
+            "edited_at": db_message.edited_at
+        })
     # Возвращаем статус успешного обновления сообщения
     return {"detail": "Сообщение обновлено"}
 
-@router.delete("/messages/{message_id}")
-async def delete_message(message_id: str, token: str = Depends(oauth2_scheme)):
+@router.delete("/messages/{message_id}", dependencies=[write_admission("delete_message")])
+async def delete_message(message_id: str, token: str = Depends(oauth2_scheme),
+                         db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для "удаления" своих сообщений по message id
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-    
-    # Создание сессии БД
-    db = SessionLocal()
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
-    
-    # Получение идентификатора пользователя из токена
-    sender_id = allow_token.user_id
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    sender_id = token_user_id(token)
 
     # Поиск сообщения в базе данных, включая проверку is_deleted
-    db_message = db.query(Message).filter(
-        Message.id == message_id,
-        Message.sender_id == sender_id,
-        Message.is_deleted == False
-    ).first()
+    db_message = await db.scalar(OWN_MESSAGE, {"message_id": message_id, "sender_id": sender_id})
     if not db_message:
-        db.close()
         not_found("Сообщение не найдено")
-    
+
     # Установка флага `is_deleted` в True
     db_message.is_deleted = True
+    await db.flush()
+    # Обновление бесед отправителя и получателя в той же транзакции
+    await record_deleted_message(db, db_message)
+    # Новая версия входящих получателя
+    await bump_versions(db, inbox_collection(db_message.recipient_id))
     # Фиксация изменений в БД
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
+    # Уведомление получателя об удалении сообщения
+    await broker.publish(db_message.recipient_id, "message.deleted", {"id": message_id})
     # Возвращаем статус успешного удаления сообщения
-    return {"detail": "Сообщение удалено"}
\ No newline at end of file
+    return {"detail": "Сообщение удалено"}
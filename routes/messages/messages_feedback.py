@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends
-from utils.jwt import validate_token
-from utils.sqlalchemy import SessionLocal
-from utils.errors import bad_request, unauthorized, forbidden, not_found
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.jwt import token_user_id
+from utils.sqlalchemy import get_db
+from utils.broker import broker
+from utils.limits import write_admission
+from utils.etags import inbox_collection, bump_versions
+from utils.errors import bad_request, forbidden, not_found
+from utils.statements import MESSAGE_REACTIONS, MESSAGE_STATE
 from fastapi.security import OAuth2PasswordBearer
-from scheme.models import Message, Token, Like, Dislike
 
 # Инициализация роутера
 router = APIRouter(
@@ -13,118 +17,85 @@ router = APIRouter(
 # Схема аутентификации
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/signin")
 
-@router.post('/messages/{message_id}/like')
-async def like_message(message_id: str, token: str = Depends(oauth2_scheme)):
-    """
-    # Маршрут для создания лайка для сообщения  
-    # (кроме своих) по message id
-    """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-
-    # Создание сессии БД
-    db = SessionLocal()
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
+# Функция для записи реакции на сообщение одним запросом:
+# реакция (user_id, message_id) вставляется или заменяется,
+# а счётчики likes_count/dislikes_count сообщения меняются в том же запросе.
+# Свои и удалённые сообщения оценивать нельзя.
+# Возвращает автора и получателя сообщения и новые счётчики или None
+async def set_reaction(db, message_id, user_id, reaction_type):
+    return (await db.execute(MESSAGE_REACTIONS[reaction_type],
+                             {"reactor_id": user_id, "target_id": message_id})).first()
 
-    # Получение идентификатора пользователя из токена
-    user_id = allow_token.user_id
+# Функция для уведомления автора сообщения о новой реакции
+async def publish_reaction(result, message_id, user_id, reaction_type):
+    await broker.publish(result.sender_id, "message.reaction", {
+        "id": message_id,
+        "user_id": user_id,
+        "reaction_type": reaction_type,
+        "likes_count": result.likes_count,
+        "dislikes_count": result.dislikes_count
+    })
 
+# Функция для выяснения причины, по которой реакция не записалась
+async def reaction_error(db, message_id, user_id, own_detail, exists_detail):
+    message = (await db.execute(MESSAGE_STATE, {"message_id": message_id})).first()
     # Проверка, что пользователь не является отправителем сообщения
-    sender_id = (
-        db.query(Message.sender_id)
-        .filter(Message.id == message_id)
-        .scalar()
-    )
-    if sender_id == user_id:
-        db.close()
-        forbidden("Вы не можете ставить лайк на своё сообщение")
-    
-    # Проверка, был ли уже установлен лайк для данного сообщения
-    existing_like = (
-        db.query(Like)
-        .filter(Like.user_id == user_id, Like.message_id == message_id)
-        .first()
-    )
-    if existing_like:
-        db.close()
-        bad_request("Лайк уже установлен")
+    if message and message.sender_id == user_id:
+        forbidden(own_detail)
     # Проверка, было ли сообщение удалено
-    message = (
-        db.query(Message)
-        .filter(Message.id == message_id, Message.is_deleted == False)
-        .first()
-    )
-    if not message:
-        db.close()
+    if message is None or message.is_deleted:
         not_found("Сообщение не найдено")
-    # Создание записи о лайке
-    like = Like(user_id=user_id, message_id=message_id, is_like=True)
-    db.add(like)
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
-    # Возвращаем статус успешной установки лайка
-    return {"detail": "Лайк установлен"}
+    # Реакция уже установлена
+    bad_request(exists_detail)
 
-@router.post('/messages/{message_id}/dislike')
-async def dislike_message(message_id: str, token: str = Depends(oauth2_scheme)):
+@router.post('/messages/{message_id}/like', dependencies=[write_admission("like_message")])
+async def like_message(message_id: str, token: str = Depends(oauth2_scheme),
+                       db: AsyncSession = Depends(get_db)):
     """
-    # Маршрут для создания дислайка для сообщения 
+    # Маршрут для создания лайка для сообщения
     # (кроме своих) по message id
+
+    **дислайк на этом сообщении, если был, заменяется лайком**
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-    
-    # Создание сессии БД
-    db = SessionLocal()
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Создание записи о лайке одним запросом
+    result = await set_reaction(db, message_id, user_id, "like")
+    if result is None:
+        await reaction_error(db, message_id, user_id,
+                             "Вы не можете ставить лайк на своё сообщение",
+                             "Лайк уже установлен")
+    # Новая версия входящих получателя (изменились счётчики)
+    await bump_versions(db, inbox_collection(result.recipient_id))
+    await db.commit()
+    # Уведомление автора сообщения
+    await publish_reaction(result, message_id, user_id, "like")
+    # Возвращаем статус успешной установки лайка
+    return {"detail": "Лайк установлен"}
 
-    # Получение идентификатора пользователя из токена
-    user_id = allow_token.user_id
+@router.post('/messages/{message_id}/dislike', dependencies=[write_admission("dislike_message")])
+async def dislike_message(message_id: str, token: str = Depends(oauth2_scheme),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    # Маршрут для создания дислайка для сообщения
+    # (кроме своих) по message id
 
-    # Проверка, что пользователь не является отправителем сообщения
-    sender_id = (
-        db.query(Message.sender_id)
-        .filter(Message.id == message_id)
-        .scalar()
-    )
-    if sender_id == user_id:
-        db.close()
-        forbidden("Вы не можете ставить дислайк на своё сообщение")
+    **лайк на этом сообщении, если был, заменяется дислайком**
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
 
-    # Проверка, был ли уже установлен дислайк для данного сообщения
-    existing_dislike = (
-        db.query(Dislike)
-        .filter(Dislike.user_id == user_id, Dislike.message_id == message_id)
-        .first()
-    )
-    if existing_dislike:
-        db.close()
-        bad_request("Дислайк уже установлен")
-    # Проверка, было ли сообщение удалено
-    message = (
-        db.query(Message)
-        .filter(Message.id == message_id, Message.is_deleted == False)
-        .first()
-    )
-    if not message:
-        db.close()
-        not_found("Сообщение не найдено")
-    # Создание записи о дислайке
-    dislike = Dislike(user_id=user_id, message_id=message_id, is_dislike=True)
-    db.add(dislike)
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    # Создание записи о дислайке одним запросом
+    result = await set_reaction(db, message_id, user_id, "dislike")
+    if result is None:
+        await reaction_error(db, message_id, user_id,
+                             "Вы не можете ставить дислайк на своё сообщение",
+                             "Дислайк уже установлен")
+    # Новая версия входящих получателя (изменились счётчики)
+    await bump_versions(db, inbox_collection(result.recipient_id))
+    await db.commit()
+    # Уведомление автора сообщения
+    await publish_reaction(result, message_id, user_id, "dislike")
     # Возвращаем статус успешной установки дислайка
     return {"detail": "Дислайк установлен"}
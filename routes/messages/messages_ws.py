@@ -0,0 +1,85 @@
+import asyncio
+import time
+from fastapi import APIRouter, WebSocket, status
+from utils.broker import broker
+from utils.jwt import validate_token
+from config import CHAT_TOKEN_CHECK_INTERVAL
+
+# Инициализация роутера
+router = APIRouter(
+    tags=["Messages"],
+    prefix="/chat"
+)
+
+# Подпротокол WebSocket, в котором браузер передаёт токен:
+# new WebSocket(url, ["bearer", token]). Заголовок Sec-WebSocket-Protocol
+# не попадает в журнал запросов, в отличие от адреса с параметрами
+TOKEN_SUBPROTOCOL = "bearer"
+
+# Функция для получения токена из заголовка Authorization: Bearer
+# или из заголовка Sec-WebSocket-Protocol: bearer, <token>
+# (браузеры не умеют задавать заголовки для WebSocket, кроме подпротоколов).
+# Возвращает токен и подпротокол, который нужно подтвердить клиенту
+def get_ws_token(websocket: WebSocket):
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() == "bearer" and value:
+        return value, None
+    protocols = [protocol.strip() for protocol in
+                 websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if len(protocols) == 2 and protocols[0] == TOKEN_SUBPROTOCOL and protocols[1]:
+        return protocols[1], TOKEN_SUBPROTOCOL
+    return None, None
+
+@router.websocket("/ws")
+async def chat_events(websocket: WebSocket):
+    """
+    # WebSocket для получения событий чата в реальном времени
+
+    - **токен**: заголовок `Authorization: Bearer <token>`
+      или подпротоколы `["bearer", "<token>"]` (браузер: `new WebSocket(url, ["bearer", token])`)
+    """
+    # Проверка токена до принятия соединения (без запроса к БД)
+    token, subprotocol = get_ws_token(websocket)
+    payload = validate_token(token) if token else None
+    if payload is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept(subprotocol=subprotocol)
+    # Подписка на события пользователя
+    subscription = broker.subscribe(payload["user_id"])
+
+    # Отправка событий клиенту по мере поступления
+    async def send_events():
+        while True:
+            event = await subscription.queue.get()
+            if event is None:
+                # Клиент не успевает читать события: закрываем соединение,
+                # после переподключения он перечитает сообщения через API
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            await websocket.send_text(event)
+
+    # Проверка токена, пока соединение открыто: после выхода (отзыв токена)
+    # или истечения срока события больше не отправляются, соединение закрывается
+    async def watch_token():
+        while True:
+            await asyncio.sleep(max(0, min(CHAT_TOKEN_CHECK_INTERVAL, payload["exp"] - time.time())))
+            if validate_token(token) is None:
+                sender.cancel()
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+
+    sender = asyncio.create_task(send_events())
+    watcher = asyncio.create_task(watch_token())
+    try:
+        # Чтение входящих кадров нужно, чтобы заметить отключение клиента
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        watcher.cancel()
+        broker.unsubscribe(subscription)
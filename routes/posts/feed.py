@@ -0,0 +1,110 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from utils.responses import ORJSONResponse
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.jwt import token_user_id
+from utils.sqlalchemy import get_db
+from utils.statements import USER_EXISTS
+from utils.replicas import get_read_db
+from utils.errors import not_found, bad_request
+from utils.limits import write_admission
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+from utils.timelines import (backfill_timeline, change_followers_count, remove_author_from_timeline,
+                             feed_page_query)
+from fastapi.security import OAuth2PasswordBearer
+from scheme.models import Follow, PostPage
+
+# Инициализация роутера
+router = APIRouter(
+    tags=["Blog"],
+    prefix="/blog"
+)
+# Схема аутентификации
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/signin")
+
+@router.post("/follow/{user_id}", dependencies=[write_admission("follow_user")])
+async def follow_user(user_id: int, token: str = Depends(oauth2_scheme),
+                      db: AsyncSession = Depends(get_db)):
+    """
+    # Маршрут для подписки на посты пользователя по user id
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    follower_id = token_user_id(token)
+    if follower_id == user_id:
+        bad_request("Нельзя подписаться на самого себя")
+
+    # Проверка, что пользователь существует
+    if await db.scalar(USER_EXISTS, {"user_id": user_id}) is None:
+        not_found("Пользователь не найден")
+
+    # Создание подписки (повторная подписка ничего не меняет)
+    created = (await db.execute(
+        insert(Follow.__table__)
+        .values(follower_id=follower_id, followee_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(Follow.__table__.c.followee_id)
+    )).first()
+    if created is None:
+        bad_request("Вы уже подписаны на этого пользователя")
+
+    # Счётчик подписчиков и заполнение ленты последними постами автора
+    await change_followers_count(db, user_id, 1)
+    await backfill_timeline(db, follower_id, user_id)
+    # Фиксация изменений в БД
+    await db.commit()
+    return {"detail": f"Вы подписались на пользователя с ID {user_id}"}
+
+@router.delete("/follow/{user_id}", dependencies=[write_admission("unfollow_user")])
+async def unfollow_user(user_id: int, token: str = Depends(oauth2_scheme),
+                        db: AsyncSession = Depends(get_db)):
+    """
+    # Маршрут для отписки от постов пользователя по user id
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    follower_id = token_user_id(token)
+
+    # Удаление подписки
+    deleted = (await db.execute(
+        Follow.__table__.delete()
+        .where(Follow.__table__.c.follower_id == follower_id,
+               Follow.__table__.c.followee_id == user_id)
+        .returning(Follow.__table__.c.followee_id)
+    )).first()
+    if deleted is None:
+        not_found("Подписка не найдена")
+
+    # Счётчик подписчиков и удаление постов автора из ленты
+    await change_followers_count(db, user_id, -1)
+    await remove_author_from_timeline(db, follower_id, user_id)
+    # Фиксация изменений в БД
+    await db.commit()
+    return {"detail": f"Вы отписались от пользователя с ID {user_id}"}
+
+@router.get("/feed", response_model=PostPage)
+async def get_feed(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                   cursor: Optional[str] = None,
+                   token: str = Depends(oauth2_scheme),
+                   db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для постраничного просмотра ленты:
+    # свои посты и посты пользователей, на которых вы подписаны (сначала новые)
+
+    - **limit**: количество постов на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Получение одной страницы ленты
+    cursor_position = decode_cursor(cursor) if cursor else None
+    rows = (await db.execute(feed_page_query(user_id, limit + 1, cursor_position))).all()
+
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].post_id)
+
+    # Возвращаем страницу ленты и курсор следующей страницы
+    return ORJSONResponse({"posts": [row._asdict() for row in rows], "next_cursor": next_cursor})
@@ -1,9 +1,22 @@
-from fastapi import APIRouter, Depends
-from utils.jwt import validate_token
-from utils.sqlalchemy import SessionLocal
-from utils.errors import unauthorized, not_found, bad_request, forbidden
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
+from utils.responses import ORJSONResponse, wants_ndjson, ndjson_response
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.jwt import token_user_id
+from utils.sqlalchemy import get_db
+from utils.replicas import get_read_db
+from utils.errors import not_found, bad_request, forbidden
+from utils.limits import write_admission
+from utils.etags import POSTS_COLLECTION, collection_version, not_modified, bump_versions
+from utils.timelines import fan_out_post
+from utils.reactions import REACTION_TYPES
+from utils.statements import POST_BY_ID, OWN_POST, POST_AUTHOR, POST_REACTIONS
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, encode_rank_cursor
+from utils.search import ranked_search
 from fastapi.security import OAuth2PasswordBearer
-from scheme.models import Post, PostSend, PostReaction, PostReactionCreate, Token
+from scheme.models import (Post, PostSend, PostReactionCreate,
+                           POST_COLUMNS, PostPage, PostSearchPage)
 import uuid
 import datetime
 
@@ -14,26 +27,14 @@ router = APIRouter(
 # Схема аутентификации
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/signin")
 
-@router.post("/post")
-async def create_post(post: PostSend, token: str = Depends(oauth2_scheme)):
+@router.post("/post", dependencies=[write_admission("create_post")])
+async def create_post(post: PostSend, token: str = Depends(oauth2_scheme),
+                      db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для создания поста
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-    
-    # Создание сессии БД
-    db = SessionLocal()
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
-    
-    # Получение идентификатора пользователя из токена
-    sender_id = allow_token.user_id
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    sender_id = token_user_id(token)
 
     # Генерация уникального идентификатора для поста
     post_id = uuid.uuid4()
@@ -50,212 +51,192 @@ async def create_post(post: PostSend, token: str = Depends(oauth2_scheme)):
     )
     # Добавление поста в сессию БД
     db.add(new_post)
+    await db.flush()
+    # Рассылка поста по лентам подписчиков в той же транзакции
+    await fan_out_post(db, post_id, sender_id, new_post.created_at)
+    # Новая версия списка постов
+    await bump_versions(db, POSTS_COLLECTION)
     # Фиксация изменений в БД
-    db.commit()
-    # Обновление автоматически сгенерированного идентификатора
-    db.refresh(new_post)
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
     # возвращаем статус успешного создания поста
     return {"detail": "Пост успешно создан", "post_id": post_id}
 
 
-@router.get("/posts")
-async def get_all_posts(token: str = Depends(oauth2_scheme)):
+@router.get("/posts", response_model=PostPage)
+async def get_all_posts(request: Request,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None,
+                        token: str = Depends(oauth2_scheme),
+                        db: AsyncSession = Depends(get_read_db)):
     """
-    # Маршрут для просмотра всех постов
+    # Маршрут для постраничного просмотра постов (сначала новые)
+
+    - **limit**: количество постов на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+
+    **с заголовком `Accept: application/x-ndjson` все посты (начиная с cursor)**
+    **отдаются потоком, по одному JSON-объекту на строку, limit не учитывается**
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-
-    # Создание сессии БД
-    db = SessionLocal()
-
-    # Получение всех постов из БД
-    posts = db.query(Post).all()
-
-    # Закрытие сессии БД
-    db.close()
-
-    # Преобразование списка постов в словари для возврата в ответе
-    formatted_posts = []
-    for post in posts:
-        formatted_posts.append({
-            "post_id": post.id,
-            "user_id": post.user_id,
-            "post": post.post,
-            "likes_count": post.likes_count,
-            "dislikes_count": post.dislikes_count,
-            "created_at": post.created_at,
-            "edited_at": post.edited_at,
-        })
-    # Возвращаем все посты
-    return formatted_posts
-
-
-@router.post("/post/{post_id}/reaction")
-async def reaction_on_post(post_id: str, reaction: PostReactionCreate, token: str = Depends(oauth2_scheme)):
+    # Проверка валидности токена (без запроса к БД)
+    token_user_id(token)
+
+    # Запрос постов по индексу (created_at, id).
+    # Выбираются только нужные столбцы, без создания ORM-объектов
+    query = select(*POST_COLUMNS).order_by(Post.created_at.desc(), Post.id.desc())
+    if cursor:
+        # Продолжение выдачи после последнего поста предыдущей страницы
+        created_at, post_id = decode_cursor(cursor)
+        query = query.where(tuple_(Post.created_at, Post.id) < (created_at, post_id))
+
+    # Потоковая выдача всех постов для выгрузок
+    if wants_ndjson(request):
+        return ndjson_response(query)
+
+    # Проверка версии списка: если у клиента она актуальна, ответ 304 без запроса постов
+    version = await collection_version(db, POSTS_COLLECTION)
+    response = not_modified(request, version)
+    if response:
+        return response
+
+    # Одна страница постов, лишняя запись нужна, чтобы понять, есть ли следующая страница
+    query = query.limit(limit + 1)
+    rows = (await db.execute(query)).all()
+
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].post_id)
+
+    # Возвращаем страницу постов и курсор следующей страницы с версией списка (ETag),
+    # строки сериализуются orjson за один проход
+    return ORJSONResponse({"posts": [row._asdict() for row in rows], "next_cursor": next_cursor},
+                          headers=version.headers)
+
+
+@router.get("/search", response_model=PostSearchPage)
+async def search_posts(q: str,
+                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None,
+                       token: str = Depends(oauth2_scheme),
+                       db: AsyncSession = Depends(get_read_db)):
     """
-    # Маршрут для реакции на пост,
-    # реакция может быть только like или dislike  
+    # Маршрут для полнотекстового поиска по постам
+    # (сначала самые релевантные)
 
-    **если вы уже поставили like, то повторно поставить его уже нельзя,**  
-    **но можно поставить dislike, тогда like обнулится и его снова можно будет поставить**  
-
-    - **{"type": "like"}**
-    - **{"type": "dislike"}**
+    - **q**: поисковый запрос: слова, "точная фраза", -исключение, or
+    - **limit**: количество постов на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
+    # Проверка валидности токена (без запроса к БД)
+    token_user_id(token)
 
-    # Создание сессии БД
-    db = SessionLocal()
+    # Поиск одной страницы постов по GIN-индексу с сортировкой по релевантности
+    query = ranked_search(select(*POST_COLUMNS), Post.search_vector, Post.id, q, limit, cursor)
+    rows = (await db.execute(query)).all()
 
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1].rank, rows[-1].post_id)
 
-    # Получение идентификатора пользователя из токена
-    user_id = allow_token.user_id
+    # Возвращаем страницу найденных постов и курсор следующей страницы
+    return ORJSONResponse({"posts": [row._asdict() for row in rows], "next_cursor": next_cursor})
 
-    # Получение поста из БД
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
-        db.close()
-        not_found("Пост не найден")
 
-    # Проверка, оценивал ли пользователь пост ранее
-    existing_reaction = db.query(PostReaction).filter(
-        PostReaction.post_id == post_id,
-        PostReaction.user_id == user_id
-    ).first()
-
-    if existing_reaction:
-        # Если пользователь оценил пост ранее
-        if existing_reaction.reaction_type == reaction.type:
-            # Если оценка совпадает, возвращаем ошибку
-            bad_request("Вы уже оценили этот пост")
-        else:
-            # Если оценка отличается, изменяем оценку на новую
-            if existing_reaction.reaction_type == "like":
-                post.likes_count -= 1
-            elif existing_reaction.reaction_type == "dislike":
-                post.dislikes_count -= 1
-
-            db.delete(existing_reaction)
-
-    # Запрет оценки своих постов
-    if post.user_id == user_id:
-        db.close()
-        bad_request("Вы не можете оценивать свои посты")
-                
-    # Апдейт счётчика реакций
-    if reaction.type == "like":
-        post.likes_count += 1
-    elif reaction.type == "dislike":
-        post.dislikes_count += 1
-    # Запись новой реакции
-    new_reaction = PostReaction(
-        user_id=user_id,
-        post_id=post_id,
-        reaction_type=reaction.type
-    )
-    # Добавление реакции в сессию БД 
-    db.add(new_reaction)
+@router.post("/post/{post_id}/reaction", dependencies=[write_admission("reaction_on_post")])
+async def reaction_on_post(post_id: str, reaction: PostReactionCreate, token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_db)):
+    """
+    # Маршрут для реакции на пост,
+    # реакция может быть только like или dislike
+
+    **если вы уже поставили like, то повторно поставить его уже нельзя,**
+    **но можно поставить dislike, тогда like обнулится и его снова можно будет поставить**
+
+    - **{"type": "like"}**
+    - **{"type": "dislike"}**
+    """
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
+    # Проверка типа реакции
+    if reaction.type not in REACTION_TYPES:
+        bad_request("Реакция может быть только like или dislike")
+
+    # Запись реакции и обновление счётчиков поста одним запросом,
+    # свои посты оценивать нельзя
+    result = (await db.execute(POST_REACTIONS[reaction.type],
+                               {"reactor_id": user_id, "target_id": post_id})).first()
+    if result is None:
+        # Ничего не изменилось: выясняем причину (только при ошибке)
+        post_author_id = await db.scalar(POST_AUTHOR, {"post_id": post_id})
+        if post_author_id is None:
+            not_found("Пост не найден")
+        if post_author_id == user_id:
+            # Запрет оценки своих постов
+            bad_request("Вы не можете оценивать свои посты")
+        # Такая же оценка уже стоит
+        bad_request("Вы уже оценили этот пост")
+    # Новая версия списка постов: в нём отдаются счётчики реакций
+    await bump_versions(db, POSTS_COLLECTION)
     # Фиксация изменений в БД
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
     # Возвращаем статус успешной реакции
     return {"detail": f"Вы поставили {reaction.type} на пост с ID: {post_id}"}
 
 
-@router.put("/post/{post_id}")
-async def edit_post(post_id: str, updated_post: PostSend, token: str = Depends(oauth2_scheme)):
+@router.put("/post/{post_id}", dependencies=[write_admission("edit_post")])
+async def edit_post(post_id: str, updated_post: PostSend, token: str = Depends(oauth2_scheme),
+                    db: AsyncSession = Depends(get_db)):
     """
-    # Маршрут для редактирования своих постов  
+    # Маршрут для редактирования своих постов
     **чужие посты редактировать нельзя**
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-
-    # Создание сессии БД
-    db = SessionLocal()
-
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
-
-    # Получение идентификатора пользователя из токена
-    user_id = allow_token.user_id
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
 
     # Получение поста из БД
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.scalar(POST_BY_ID, {"post_id": post_id})
     if not post:
-        db.close()
         not_found("Пост не найден")
 
     if post.user_id != user_id:
         # Пользователь пытается редактировать чужой пост
-        db.close()
         forbidden("Вы можете редактировать только свои посты")
 
     # Обновление содержимого поста
     post.post = updated_post.post
     post.edited_at = datetime.datetime.now()
+    # Новая версия списка постов
+    await bump_versions(db, POSTS_COLLECTION)
 
     # Фиксация изменений в БД
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
 
     # Возвращаем успешный статус
     return {"detail": f"Пост с ID {post_id} успешно обновлен"}
 
 
-@router.delete("/post/{post_id}")
-async def delete_post(post_id: str, token: str = Depends(oauth2_scheme)):
+@router.delete("/post/{post_id}", dependencies=[write_admission("delete_post")])
+async def delete_post(post_id: str, token: str = Depends(oauth2_scheme),
+                      db: AsyncSession = Depends(get_db)):
     """
     # Маршрут для удаления поста
     """
-    # Проверка валидности токена
-    valid_token = validate_token(token)
-    if not valid_token:
-        unauthorized("Упс! Вам нужно авторизироваться")
-
-    # Создание сессии БД
-    db = SessionLocal()
-
-    # Проверка наличия токена в БД
-    allow_token = db.query(Token).filter(Token.token == token).first()
-    if not allow_token:
-        db.close()
-        unauthorized("Некорректный токен")
-
-    # Получение идентификатора пользователя из токена
-    user_id = allow_token.user_id
-    
+    # Получение идентификатора пользователя из токена (проверка без запроса к БД)
+    user_id = token_user_id(token)
+
     # Поиск поста в БД
-    post = db.query(Post).filter(Post.id == post_id, Post.user_id == user_id).first()
+    post = await db.scalar(OWN_POST, {"post_id": post_id, "user_id": user_id})
     if not post:
-        db.close()
         not_found("Пост не найден")
-    
+
     # Удаление поста
-    db.delete(post)
+    await db.delete(post)
+    # Новая версия списка постов
+    await bump_versions(db, POSTS_COLLECTION)
     # Фиксация изменений в БД
-    db.commit()
-    # Закрытие сессии БД
-    db.close()
+    await db.commit()
     return {"detail": "Пост успешно удален"}
-
@@ -0,0 +1,101 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from scheme.models import User, USER_COLUMNS, UserOut, UserPage
+from utils.replicas import get_read_db
+from utils.errors import bad_request
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_id_cursor, decode_id_cursor
+from utils.responses import ORJSONResponse, wants_ndjson, ndjson_response
+from utils.etags import USERS_COLLECTION, collection_version, not_modified
+
+router = APIRouter(
+    tags=["Users"],
+    prefix="/users"
+)
+
+# Количество подсказок по умолчанию и максимальная длина префикса
+SEARCH_LIMIT = 10
+MAX_PREFIX_LENGTH = 50
+
+# Функция для построения условия "имя начинается с prefix" (без учёта регистра)
+# по индексу lower(username) text_pattern_ops. Вместо LIKE используется диапазон
+# prefix <= имя < следующая строка после prefix: такой запрос использует индекс
+# и в подготовленных запросах asyncpg, где значение параметра неизвестно при планировании
+def username_prefix(prefix):
+    username = func.lower(User.username)
+    condition = username.op("~>=~")(prefix)
+    if ord(prefix[-1]) < 0x10FFFF:
+        upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        condition = condition & username.op("~<~")(upper_bound)
+    return condition
+
+@router.get("", response_model=UserPage)
+async def read_users(request: Request,
+                     limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     cursor: Optional[str] = None,
+                     db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для постраничного получения списка пользователей (по id)
+
+    - **limit**: количество пользователей на странице
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+
+    **с заголовком `Accept: application/x-ndjson` все пользователи (начиная с cursor)**
+    **отдаются потоком, по одному JSON-объекту на строку, limit не учитывается**
+    """
+    # Запрос пользователей по первичному ключу без создания ORM-объектов
+    query = select(*USER_COLUMNS).order_by(User.id)
+    if cursor:
+        # Продолжение выдачи после последнего пользователя предыдущей страницы
+        query = query.where(User.id > decode_id_cursor(cursor))
+
+    # Потоковая выдача всех пользователей для выгрузок
+    if wants_ndjson(request):
+        return ndjson_response(query)
+
+    # Проверка версии списка: если у клиента она актуальна, ответ 304 без запроса пользователей
+    version = await collection_version(db, USERS_COLLECTION)
+    response = not_modified(request, version)
+    if response:
+        return response
+
+    # Одна страница пользователей, лишняя запись нужна, чтобы понять, есть ли следующая страница
+    rows = (await db.execute(query.limit(limit + 1))).all()
+
+    # Формирование курсора следующей страницы
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_id_cursor(rows[-1].id)
+
+    # Возвращаем страницу пользователей и курсор следующей страницы с версией списка (ETag)
+    return ORJSONResponse({"users": [row._asdict() for row in rows], "next_cursor": next_cursor},
+                          headers=version.headers)
+
+@router.get("/search", response_model=List[UserOut])
+async def search_users(prefix: str,
+                       limit: int = Query(SEARCH_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+                       db: AsyncSession = Depends(get_read_db)):
+    """
+    # Маршрут для поиска пользователей по началу имени (подсказки при вводе)
+
+    - **prefix**: начало имени пользователя, регистр не учитывается
+    - **limit**: количество подсказок
+    """
+    # Проверка префикса
+    prefix = prefix.strip().lower()
+    if not prefix or len(prefix) > MAX_PREFIX_LENGTH:
+        bad_request(f"Префикс должен содержать от 1 до {MAX_PREFIX_LENGTH} символов")
+
+    # Первые limit пользователей по индексу lower(username) text_pattern_ops.
+    # Сортировка в порядке этого индекса (USING ~<~), чтобы не сортировать все совпадения
+    rows = (await db.execute(
+        select(*USER_COLUMNS)
+        .where(username_prefix(prefix))
+        .order_by(text("lower(users.username) USING ~<~"))
+        .limit(limit)
+    )).all()
+
+    # Возвращаем найденных пользователей
+    return ORJSONResponse([row._asdict() for row in rows])
@@ -1,8 +1,10 @@
 import datetime
+import uuid
+from typing import List, Optional
 from pydantic import BaseModel
-from sqlalchemy.orm import declarative_base
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy.orm import declarative_base, deferred
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy import BigInteger, Column, FetchedValue, Integer, String, DateTime, Boolean, Index, UniqueConstraint, func, text
 
 Base = declarative_base()
 
@@ -13,6 +15,18 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     password_hash = Column(String)
+    followers_count = Column(Integer, default=0)
+    # рассылка постов по лентам приостановлена (много подписчиков)
+    fanout_paused = Column(Boolean, default=False)
+    # посты автора подмешиваются в ленты при чтении
+    feed_merged = Column(Boolean, default=False)
+
+# индекс для поиска пользователей по началу имени без учёта регистра
+Index("ix_users_username_prefix", func.lower(User.username).label("username_lower"),
+      postgresql_ops={"username_lower": "text_pattern_ops"})
+
+# частичный индекс авторов, посты которых подмешиваются в ленты при чтении
+Index("ix_users_feed_merged", User.id, postgresql_where=User.feed_merged)
 
 # схема для запроса на создание пользователя
 class UserAuth(BaseModel):
@@ -22,14 +36,33 @@ class UserAuth(BaseModel):
 # модель сообщения
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # частичный индекс для постраничной выдачи входящих (только неудалённые)
+        Index("ix_messages_inbox_active", "recipient_id", "created_at", "id",
+              postgresql_where=text("is_deleted = false")),
+        # GIN-индекс для полнотекстового поиска по сообщениям
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, index=True)
-    sender_id = Column(Integer)
+    sender_id = Column(Integer, index=True)
     recipient_id = Column(Integer)
     message = Column(String)
-    created_at = Column(DateTime, default=datetime.datetime.now())
-    edited_at = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    edited_at = Column(DateTime, nullable=True)
     is_deleted = Column(Boolean, default=False)
+    likes_count = Column(Integer, default=0)
+    dislikes_count = Column(Integer, default=0)
+    # поисковый вектор, заполняется триггером БД при вставке и редактировании текста
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
+
+# частичный индекс для истории переписки двух пользователей в обе стороны:
+# пара (меньший id, больший id) не зависит от того, кто отправитель
+Index("ix_messages_conversation",
+      func.least(Message.sender_id, Message.recipient_id),
+      func.greatest(Message.sender_id, Message.recipient_id),
+      Message.created_at, Message.id,
+      postgresql_where=text("is_deleted = false"))
 
 # схема для запроса на создание сообщения
 class MessageSend(BaseModel):
@@ -43,41 +76,53 @@ class MessageUpdate(BaseModel):
 # модель токена
 class Token(Base):
     __tablename__ = "tokens"
+    __table_args__ = (
+        # частичный индекс для чтения отозванных токенов
+        Index("ix_tokens_revoked_at", "revoked_at", postgresql_where=text("revoked_at IS NOT NULL")),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, index=True)
     token = Column(String, index=True)
     secret = Column(String, index=True)
-    user_id = Column(Integer)
+    user_id = Column(Integer, index=True)
+    # срок действия токена и время отзыва (выход), время в UTC
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
 
-# модель лайка для сообщений
-class Like(Base):
-    __tablename__ = "likes"
+# модель реакции (like/dislike) на сообщение
+class MessageReaction(Base):
+    __tablename__ = "message_reactions"
+    __table_args__ = (
+        # одна реакция от пользователя на сообщение
+        UniqueConstraint("user_id", "message_id", name="uq_message_reactions_user_message"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer)
-    message_id = Column(String)
-    is_like = Column(Boolean)
-
-# модель дислайка для сообщений
-class Dislike(Base):
-    __tablename__ = "dislikes"
-
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer)
-    message_id = Column(String)
-    is_dislike = Column(Boolean)    
+    message_id = Column(UUID(as_uuid=True), index=True)
+    reaction_type = Column(String)
 
 # модель поста
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # индекс для постраничной выдачи постов по (created_at, id)
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # индекс для выдачи постов автора по времени
+        Index("ix_posts_user_id_created_at", "user_id", "created_at", "id"),
+        # GIN-индекс для полнотекстового поиска по постам
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, index=True)
     user_id = Column(Integer)
     post = Column(String)
-    likes_count = Column(Integer)
-    dislikes_count = Column(Integer)
-    created_at = Column(DateTime, default=datetime.datetime.now())
+    likes_count = Column(Integer, default=0)
+    dislikes_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.now)
     edited_at = Column(DateTime, nullable=True)
+    # поисковый вектор, заполняется триггером БД при вставке и редактировании текста
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
 
 # схема для запроса на создание поста
 class PostSend(BaseModel):
@@ -86,12 +131,167 @@ class PostSend(BaseModel):
 # модель реакции на пост
 class PostReaction(Base):
     __tablename__ = "post_reactions"
+    __table_args__ = (
+        # одна реакция от пользователя на пост
+        UniqueConstraint("user_id", "post_id", name="uq_post_reactions_user_post"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer)
-    post_id = Column(UUID(as_uuid=True), primary_key=True, index=True)
+    post_id = Column(UUID(as_uuid=True), index=True)
     reaction_type = Column(String)
 
+# модель подписки пользователя на автора
+class Follow(Base):
+    __tablename__ = "follows"
+
+    follower_id = Column(Integer, primary_key=True)
+    followee_id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+# модель записи в ленте пользователя
+class Timeline(Base):
+    __tablename__ = "timelines"
+
+    user_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, primary_key=True)
+    post_id = Column(UUID(as_uuid=True), primary_key=True, index=True)
+    author_id = Column(Integer)
+
+# модель беседы: по одной строке на каждого участника переписки,
+# с последним сообщением и числом непрочитанных для этого участника
+class Conversation(Base):
+    __tablename__ = "conversations"
+    __table_args__ = (
+        # индекс для постраничной выдачи бесед пользователя по последней активности
+        Index("ix_conversations_user_activity", "user_id", "last_activity_at", "peer_id"),
+    )
+
+    user_id = Column(Integer, primary_key=True)
+    peer_id = Column(Integer, primary_key=True)
+    last_message_id = Column(UUID(as_uuid=True), nullable=True)
+    last_message = Column(String, nullable=True)
+    last_sender_id = Column(Integer, nullable=True)
+    last_activity_at = Column(DateTime)
+    unread_count = Column(Integer, default=0)
+    last_read_at = Column(DateTime, nullable=True)
+
+# модель версии списка (все посты, пользователи, входящие пользователя):
+# версия растёт при каждом изменении списка и служит для ETag
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(BigInteger, default=0)
+    updated_at = Column(DateTime(timezone=True))
+
 # схема для запроса на создание реакции на пост
 class PostReactionCreate(BaseModel):
-    type: str
\ No newline at end of file
+    type: str
+# Столбцы, которые отдаются в списках. Списки читаются выборкой этих столбцов
+# (без создания ORM-объектов) и сразу сериализуются в JSON
+USER_COLUMNS = (User.id, User.username)
+POST_COLUMNS = (
+    Post.id.label("post_id"), Post.user_id, Post.post,
+    Post.likes_count, Post.dislikes_count, Post.created_at, Post.edited_at,
+)
+MESSAGE_COLUMNS = (
+    Message.id, Message.sender_id, Message.recipient_id, Message.message,
+    Message.created_at, Message.edited_at, Message.is_deleted,
+    Message.likes_count, Message.dislikes_count,
+)
+CONVERSATION_COLUMNS = (
+    Conversation.peer_id, Conversation.last_message_id, Conversation.last_message,
+    Conversation.last_sender_id, Conversation.last_activity_at, Conversation.unread_count,
+)
+
+# схема пользователя в списке пользователей
+class UserOut(BaseModel):
+    id: int
+    username: str
+
+# схема страницы пользователей
+class UserPage(BaseModel):
+    users: List[UserOut]
+    next_cursor: Optional[str]
+
+# схема поста в списках постов
+class PostOut(BaseModel):
+    post_id: uuid.UUID
+    user_id: int
+    post: str
+    likes_count: int
+    dislikes_count: int
+    created_at: datetime.datetime
+    edited_at: Optional[datetime.datetime]
+
+# схема страницы постов
+class PostPage(BaseModel):
+    posts: List[PostOut]
+    next_cursor: Optional[str]
+
+# схема найденного поста
+class PostSearchOut(PostOut):
+    rank: float
+
+# схема страницы найденных постов
+class PostSearchPage(BaseModel):
+    posts: List[PostSearchOut]
+    next_cursor: Optional[str]
+
+# схема сообщения в списках сообщений
+class MessageOut(BaseModel):
+    id: uuid.UUID
+    sender_id: int
+    recipient_id: int
+    message: str
+    created_at: datetime.datetime
+    edited_at: Optional[datetime.datetime]
+    is_deleted: bool
+    likes_count: int
+    dislikes_count: int
+
+# схема входящего сообщения с именем отправителя и реакцией получателя
+class InboxMessage(BaseModel):
+    message: MessageOut
+    username: Optional[str]
+    likes_count: int
+    dislikes_count: int
+    is_liked: Optional[bool]
+    is_disliked: Optional[bool]
+
+# схема страницы входящих сообщений
+class InboxPage(BaseModel):
+    messages: List[InboxMessage]
+    next_cursor: Optional[str]
+
+# схема найденного сообщения
+class MessageSearchOut(BaseModel):
+    message: MessageOut
+    username: Optional[str]
+    rank: float
+
+# схема страницы найденных сообщений
+class MessageSearchPage(BaseModel):
+    messages: List[MessageSearchOut]
+    next_cursor: Optional[str]
+
+# схема страницы истории переписки
+class MessagePage(BaseModel):
+    messages: List[MessageOut]
+    next_cursor: Optional[str]
+
+# схема беседы в списке бесед
+class ConversationOut(BaseModel):
+    peer_id: int
+    username: Optional[str]
+    last_message_id: Optional[uuid.UUID]
+    last_message: Optional[str]
+    last_sender_id: Optional[int]
+    last_activity_at: datetime.datetime
+    unread_count: int
+
+# схема страницы бесед
+class ConversationPage(BaseModel):
+    conversations: List[ConversationOut]
+    next_cursor: Optional[str]
@@ -0,0 +1,106 @@
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from config import (WEB_HOST, WEB_PORT, WEB_WORKERS, WEB_LOOP, WEB_HTTP,
+                    WEB_KEEP_ALIVE, WEB_BACKLOG, WEB_GRACEFUL_TIMEOUT, WEB_FORWARDED_ALLOW_IPS,
+                    CHAT_BROKER, RATE_LIMIT_STORE, DB_MAX_CONNECTIONS, pool_sizes)
+
+logger = logging.getLogger("uvicorn.error")
+
+# Реализации event loop и разбора HTTP в порядке предпочтения: модуль, который должен быть установлен
+LOOPS = {"uvloop": "uvloop", "asyncio": None}
+HTTP_PARSERS = {"httptools": "httptools", "h11": "h11"}
+
+# Функция для выбора реализации: заданная явно или первая установленная (auto)
+def choose(kind, options, title):
+    if kind == "auto":
+        for name, module in options.items():
+            if module is None or importlib.util.find_spec(module):
+                return name
+    if kind not in options:
+        raise ValueError(f"Неизвестная реализация {title}: {kind}")
+    return kind
+
+# Главный процесс воркеров: по сигналу остановки передаёт SIGTERM сразу всем воркерам
+# и ждёт их вместе (uvicorn останавливает воркеры по одному, и время завершения
+# складывалось бы из времени ожидания запросов каждого воркера)
+class Supervisor(Multiprocess):
+    def shutdown(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Остановлен главный процесс [%s]", self.pid)
+
+
+# Запуск API в боевом режиме: несколько процессов-воркеров на одном сокете.
+# По SIGTERM (или Ctrl+C) главный процесс передаёт сигнал воркерам, каждый воркер
+# перестаёт принимать соединения, закрывает простаивающие keep-alive соединения,
+# дожидается начатых запросов (не дольше WEB_GRACEFUL_TIMEOUT секунд)
+# и только после этого закрывает пулы соединений БД (событие shutdown в API.py)
+def main():
+    parser = argparse.ArgumentParser(description="Запуск API в боевом режиме")
+    parser.add_argument("--host", default=WEB_HOST, help="адрес для входящих соединений")
+    parser.add_argument("--port", type=int, default=WEB_PORT, help="порт для входящих соединений")
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS,
+                        help="количество процессов-воркеров (по умолчанию по числу ядер)")
+    args = parser.parse_args()
+
+    # Соединения с БД всех воркеров: пул, сверх пула и LISTEN брокера чата.
+    # Воркеры считают размер пула по WEB_WORKERS, поэтому число из --workers передаётся им
+    os.environ["WEB_WORKERS"] = str(args.workers)
+    pool_size, max_overflow = pool_sizes(args.workers)
+    connections = args.workers * (pool_size + max_overflow + 1)
+    if connections > DB_MAX_CONNECTIONS:
+        print(f"Воркеры откроют до {connections} соединений с БД ({args.workers} x ({pool_size} + "
+              f"{max_overflow} + 1)), больше DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS}: уменьшите "
+              "DB_POOL_SIZE/DB_MAX_OVERFLOW или число воркеров, или увеличьте DB_MAX_CONNECTIONS "
+              "вместе с max_connections Postgres")
+        sys.exit(1)
+
+    loop = choose(WEB_LOOP, LOOPS, "event loop")
+    http = choose(WEB_HTTP, HTTP_PARSERS, "разбора HTTP")
+    print(f"Запуск API на {args.host}:{args.port}: воркеров {args.workers}, loop {loop}, http {http}, "
+          f"соединений с БД до {connections}")
+    # Состояние в памяти воркера не видно другим воркерам
+    if args.workers > 1 and CHAT_BROKER == "memory":
+        print("Внимание: CHAT_BROKER=memory, события чата не дойдут до клиентов других воркеров, "
+              "нужен CHAT_BROKER=postgres")
+    if WEB_FORWARDED_ALLOW_IPS.strip() == "*":
+        print("Внимание: WEB_FORWARDED_ALLOW_IPS=*, клиент может сам указать любой IP "
+              "в X-Forwarded-For и обойти лимиты входа")
+    if args.workers > 1 and RATE_LIMIT_STORE == "memory":
+        print("Внимание: RATE_LIMIT_STORE=memory, лимиты пользователей считаются в каждом воркере "
+              "отдельно, общий лимит - RATE_LIMIT_STORE=sqlite")
+
+    config = uvicorn.Config(
+        "API:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=WEB_KEEP_ALIVE,
+        backlog=WEB_BACKLOG,
+        timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT,
+        # IP клиента из X-Forwarded-For только от доверенных прокси: uvicorn берёт
+        # крайний справа адрес, добавленный не доверенным прокси
+        proxy_headers=True,
+        forwarded_allow_ips=WEB_FORWARDED_ALLOW_IPS,
+        # Заголовок Server не нужен клиентам
+        server_header=False,
+    )
+    server = uvicorn.Server(config)
+    if config.workers > 1:
+        Supervisor(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+        if not server.started:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
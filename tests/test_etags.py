@@ -0,0 +1,28 @@
+import datetime
+from starlette.requests import Request
+from utils.etags import Version
+
+
+# Функция для создания запроса с заголовком If-None-Match
+def request_with(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_etag_includes_update_time():
+    version = Version(7, datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+    assert version.etag == '"7.1704067200000"'
+    assert Version().etag == '"0"'
+
+
+def test_matches_same_etag():
+    version = Version(3)
+    assert version.matches(request_with('"3"'))
+    assert not version.matches(request_with('"4"'))
+    assert not version.matches(request_with())
+
+
+def test_matches_weak_etag_and_list():
+    version = Version(3)
+    assert version.matches(request_with('"1", W/"3"'))
+    assert version.matches(request_with("*"))
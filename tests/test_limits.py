@@ -0,0 +1,24 @@
+import pytest
+from utils.limits import refill
+
+
+def test_full_bucket_lets_request_through():
+    assert refill(10, 0, 0, rate=1, burst=10) == (9, 0)
+
+
+def test_bucket_refills_over_time_up_to_burst():
+    tokens, retry_after = refill(0, 0, 100, rate=1, burst=10)
+    assert (tokens, retry_after) == (9, 0)
+
+
+def test_empty_bucket_returns_retry_after():
+    tokens, retry_after = refill(0.25, 0, 0, rate=0.5, burst=10)
+    assert tokens == 0.25
+    # до маркера не хватает 0.75, при 0.5 маркера в секунду это 1.5 с, с округлением вверх
+    assert retry_after == 2
+
+
+def test_partial_refill_is_counted():
+    tokens, retry_after = refill(0.5, 10, 11, rate=0.5, burst=10)
+    assert tokens == pytest.approx(0)
+    assert retry_after == 0
@@ -0,0 +1,43 @@
+from migrate import split_statements
+
+
+def test_splits_on_semicolon_at_line_end():
+    sql = "CREATE TABLE a (id INT);\nCREATE TABLE b (id INT);\n"
+    assert split_statements(sql) == ["CREATE TABLE a (id INT)", "CREATE TABLE b (id INT)"]
+
+
+def test_skips_comment_lines_and_empty_statements():
+    sql = "-- migrate: no-transaction\n-- комментарий; с точкой с запятой\nSELECT 1;\n\n;\n"
+    assert split_statements(sql) == ["SELECT 1"]
+
+
+def test_semicolon_inside_line_does_not_split():
+    sql = "SELECT 'a;b', 1;\n"
+    assert split_statements(sql) == ["SELECT 'a;b', 1"]
+
+
+def test_dollar_quoted_body_is_one_statement():
+    sql = (
+        "CREATE FUNCTION f() RETURNS trigger AS $$\n"
+        "BEGIN\n"
+        "    NEW.x := 1;\n"
+        "    RETURN NEW;\n"
+        "END\n"
+        "$$ LANGUAGE plpgsql;\n"
+        "DO $$\n"
+        "BEGIN\n"
+        "    COMMIT;\n"
+        "END\n"
+        "$$;\n"
+        "SELECT 2;\n"
+    )
+    statements = split_statements(sql)
+    assert len(statements) == 3
+    assert statements[0].startswith("CREATE FUNCTION") and statements[0].endswith("LANGUAGE plpgsql")
+    assert "NEW.x := 1;\n    RETURN NEW;" in statements[0]
+    assert statements[1].startswith("DO $$") and statements[1].endswith("$$")
+    assert statements[2] == "SELECT 2"
+
+
+def test_unterminated_last_statement_is_kept():
+    assert split_statements("SELECT 1;\nSELECT 2") == ["SELECT 1", "SELECT 2"]
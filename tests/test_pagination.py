@@ -0,0 +1,25 @@
+import datetime
+import uuid
+import pytest
+from fastapi import HTTPException
+from utils.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip_with_uuid():
+    created_at = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456)
+    item_id = uuid.uuid4()
+    cursor = encode_cursor(created_at, item_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, item_id)
+
+
+def test_cursor_round_trip_with_int_id():
+    created_at = datetime.datetime(2024, 5, 1)
+    assert decode_cursor(encode_cursor(created_at, 42), id_type=int) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["не-курсор", "", encode_cursor(datetime.datetime(2024, 1, 1), "x")])
+def test_invalid_cursor_is_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+import asyncpg
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from config import CHAT_BROKER, CHAT_QUEUE_SIZE
+from utils.sqlalchemy import engine
+from utils.queries import RepeatedQueryError
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres LISTEN/NOTIFY для событий чата
+NOTIFY_CHANNEL = "chat_events"
+# Ограничение Postgres на размер payload у NOTIFY
+NOTIFY_PAYLOAD_LIMIT = 7900
+# Отправка нескольких событий одним запросом: по уведомлению на каждый элемент массива.
+# Postgres объединяет одинаковые уведомления одной транзакции, поэтому одинаковые
+# события одному пользователю доставляются один раз
+NOTIFY_MANY = select(func.pg_notify(
+    NOTIFY_CHANNEL, func.unnest(bindparam("payloads", type_=ARRAY(Text))).column_valued("payload")))
+
+
+# Функция для сериализации события в JSON (даты в ISO 8601, как в REST API)
+def encode_event(event_type, data):
+    return json.dumps({"type": event_type, "data": data},
+                      default=lambda value: value.isoformat() if hasattr(value, "isoformat") else str(value))
+
+
+# Подписка одного WebSocket-соединения на события пользователя.
+# Очередь ограничена: если клиент не успевает читать события,
+# подписка помечается переполненной и соединение закрывается,
+# вместо того чтобы бесконечно копить события в памяти
+class Subscription:
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def push(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Очистка очереди и сигнал (None) для закрытия соединения
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+# Базовый брокер: хранит локальные подписки воркера и раздаёт им события.
+# Наследники определяют, как событие попадает во все воркеры
+class Broker:
+    def __init__(self, queue_size=CHAT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscriptions = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        user_subscriptions = self.subscriptions.get(subscription.user_id)
+        if user_subscriptions is not None:
+            user_subscriptions.discard(subscription)
+            if not user_subscriptions:
+                del self.subscriptions[subscription.user_id]
+
+    # Раздача уже сериализованного события открытым соединениям пользователя
+    def deliver(self, user_id, event):
+        for subscription in list(self.subscriptions.get(user_id, ())):
+            subscription.push(event)
+
+    # Публикация события для пользователя
+    async def publish(self, user_id, event_type, data):
+        await self.publish_many([(user_id, event_type, data)])
+
+    # Публикация нескольких событий сразу: список (user_id, event_type, data)
+    async def publish_many(self, events):
+        raise NotImplementedError
+
+
+# Брокер в памяти одного процесса (один воркер, тесты)
+class InMemoryBroker(Broker):
+    async def publish_many(self, events):
+        for user_id, event_type, data in events:
+            self.deliver(user_id, encode_event(event_type, data))
+
+
+# Брокер на Postgres LISTEN/NOTIFY: событие уходит в канал,
+# и каждый воркер раздаёт его своим подключённым клиентам
+class PostgresBroker(Broker):
+    def __init__(self, queue_size=CHAT_QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.connection = None
+        self.stopping = False
+
+    async def start(self):
+        self.stopping = False
+        await self.listen()
+
+    async def stop(self):
+        self.stopping = True
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+    # Отдельное соединение asyncpg только для LISTEN
+    async def listen(self):
+        url = engine.url
+        self.connection = await asyncpg.connect(
+            user=url.username, password=url.password,
+            host=url.host, port=url.port, database=url.database)
+        self.connection.add_termination_listener(self.on_connection_lost)
+        await self.connection.add_listener(NOTIFY_CHANNEL, self.on_notify)
+
+    def on_connection_lost(self, connection):
+        if not self.stopping:
+            logger.warning("Соединение LISTEN потеряно, переподключение")
+            asyncio.get_running_loop().create_task(self.reconnect())
+
+    async def reconnect(self):
+        delay = 0.5
+        while not self.stopping:
+            try:
+                await self.listen()
+                return
+            except (OSError, asyncpg.PostgresError):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def on_notify(self, connection, pid, channel, payload):
+        user_id, _, event = payload.partition(":")
+        self.deliver(int(user_id), event)
+
+    # Функция для подготовки payload уведомления "user_id:событие"
+    def payload(self, user_id, event_type, data):
+        event = encode_event(event_type, data)
+        if len(event.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            # Слишком большое событие: клиент перечитает сообщение через API
+            event = encode_event(event_type, {"id": data.get("id"), "truncated": True})
+        return f"{user_id}:{event}"
+
+    # Все события уходят одним запросом pg_notify по массиву payload
+    async def publish_many(self, events):
+        payloads = [self.payload(user_id, event_type, data) for user_id, event_type, data in events]
+        if not payloads:
+            return
+        try:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(NOTIFY_MANY, {"payloads": payloads})
+        except RepeatedQueryError:
+            # Строгий режим учёта запросов должен ронять запрос, а не терять события
+            raise
+        except Exception:
+            # Ошибка доставки события не должна ломать сам запрос
+            logger.exception("Не удалось опубликовать события: %d", len(payloads))
+
+
+# Функция для создания брокера по настройке CHAT_BROKER
+def create_broker(kind=CHAT_BROKER):
+    brokers = {"memory": InMemoryBroker, "postgres": PostgresBroker}
+    if kind not in brokers:
+        raise ValueError(f"Неизвестный брокер событий чата: {kind}")
+    return brokers[kind]()
+
+
+# Общий брокер приложения
+broker = create_broker()
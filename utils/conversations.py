@@ -0,0 +1,114 @@
+from sqlalchemy import case, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import CONVERSATION_PREVIEW_LENGTH
+from scheme.models import Conversation, Message
+
+# Поля последнего сообщения беседы
+LAST_MESSAGE_FIELDS = ("last_message_id", "last_message", "last_sender_id", "last_activity_at")
+
+# Функция для получения условий выборки сообщений переписки двух пользователей
+# в обе стороны (по индексу ix_messages_conversation)
+def conversation_filter(user_id, peer_id):
+    return (
+        func.least(Message.sender_id, Message.recipient_id) == min(user_id, peer_id),
+        func.greatest(Message.sender_id, Message.recipient_id) == max(user_id, peer_id),
+        Message.is_deleted == False,
+    )
+
+# Функция для получения условия на обе строки беседы (отправителя и получателя)
+def conversation_rows(sender_id, recipient_id):
+    return tuple_(Conversation.user_id, Conversation.peer_id).in_(
+        [(sender_id, recipient_id), (recipient_id, sender_id)])
+
+# Функция для обновления бесед после отправки сообщений (в той же транзакции).
+# messages - словари с id, sender_id, recipient_id, message, created_at.
+# Для каждой строки беседы берётся последнее сообщение в порядке истории переписки
+# (created_at, id) и число новых входящих,
+# все строки записываются одним INSERT ... ON CONFLICT в порядке ключа,
+# чтобы встречные отправки не блокировали строки друг друга в разном порядке
+async def record_sent_messages(db, messages):
+    rows = {}
+    for message in sorted(messages, key=lambda message: (message["created_at"], str(message["id"]))):
+        sender_id, recipient_id = message["sender_id"], message["recipient_id"]
+        for user_id, peer_id in ((sender_id, recipient_id), (recipient_id, sender_id)):
+            previous = rows.get((user_id, peer_id))
+            unread_count = previous["unread_count"] if previous else 0
+            if user_id != sender_id:
+                unread_count += 1
+            rows[(user_id, peer_id)] = {
+                "user_id": user_id,
+                "peer_id": peer_id,
+                "last_message_id": message["id"],
+                "last_message": message["message"][:CONVERSATION_PREVIEW_LENGTH],
+                "last_sender_id": sender_id,
+                "last_activity_at": message["created_at"],
+                "unread_count": unread_count,
+            }
+
+    query = pg_insert(Conversation.__table__).values([rows[key] for key in sorted(rows)])
+    # Последнее сообщение заменяется, только если новое не старше сохранённого
+    is_newer = query.excluded.last_activity_at >= Conversation.last_activity_at
+    last_message = {
+        field: case((is_newer, query.excluded[field]), else_=Conversation.__table__.c[field])
+        for field in LAST_MESSAGE_FIELDS
+    }
+    await db.execute(query.on_conflict_do_update(
+        index_elements=["user_id", "peer_id"],
+        set_={**last_message, "unread_count": Conversation.unread_count + query.excluded.unread_count},
+    ))
+
+# Функция для обновления текста последнего сообщения беседы после его редактирования
+async def record_edited_message(db, message):
+    await db.execute(
+        update(Conversation.__table__)
+        .where(conversation_rows(message.sender_id, message.recipient_id),
+               Conversation.last_message_id == message.id)
+        .values(last_message=message.message[:CONVERSATION_PREVIEW_LENGTH])
+    )
+
+# Функция для обновления бесед после удаления сообщения (в той же транзакции), одним запросом:
+# непрочитанное сообщение уменьшает счётчик получателя, а если удалено последнее сообщение,
+# его место занимает предыдущее неудалённое (ищется только в этом случае)
+async def record_deleted_message(db, message):
+    latest = (
+        select(Message.id, func.left(Message.message, CONVERSATION_PREVIEW_LENGTH).label("message"),
+               Message.sender_id, Message.created_at)
+        .where(*conversation_filter(message.sender_id, message.recipient_id))
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .cte("latest")
+    )
+    is_last = Conversation.last_message_id == message.id
+    is_unread = (
+        (Conversation.user_id == message.recipient_id)
+        & (Conversation.user_id != message.sender_id)
+        & (func.coalesce(Conversation.last_read_at < message.created_at, True))
+    )
+    values = {
+        field: case((is_last, select(column).scalar_subquery()),
+                    else_=Conversation.__table__.c[field])
+        for field, column in zip(LAST_MESSAGE_FIELDS[:3], latest.c)
+    }
+    # Если сообщений не осталось, время последней активности не меняется
+    values["last_activity_at"] = case(
+        (is_last, func.coalesce(select(latest.c.created_at).scalar_subquery(),
+                                Conversation.last_activity_at)),
+        else_=Conversation.last_activity_at)
+    values["unread_count"] = case(
+        (is_unread, func.greatest(Conversation.unread_count - 1, 0)),
+        else_=Conversation.unread_count)
+    await db.execute(
+        update(Conversation.__table__)
+        .where(conversation_rows(message.sender_id, message.recipient_id))
+        .values(values)
+    )
+
+# Функция для отметки беседы прочитанной, возвращает False, если беседы нет
+async def mark_read(db, user_id, peer_id, read_at):
+    result = await db.execute(
+        update(Conversation.__table__)
+        .where(Conversation.user_id == user_id, Conversation.peer_id == peer_id)
+        .values(unread_count=0, last_read_at=read_at)
+        .returning(Conversation.peer_id)
+    )
+    return result.first() is not None
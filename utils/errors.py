@@ -25,6 +25,20 @@ def not_found(_detail):
         detail = _detail
     )
 
+def too_many_requests(_detail, _retry_after):
+    raise HTTPException(
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS,
+        detail = _detail,
+        headers = {"Retry-After": str(_retry_after)}
+    )
+
+def service_unavailable(_detail, _retry_after):
+    raise HTTPException(
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail = _detail,
+        headers = {"Retry-After": str(_retry_after)}
+    )
+
 def server_error(_detail):
     raise HTTPException(
         status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
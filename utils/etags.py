@@ -0,0 +1,81 @@
+import datetime
+import random
+from email.utils import format_datetime
+from fastapi import Response
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import COLLECTION_VERSION_SHARDS
+from scheme.models import CollectionVersion
+from utils.statements import COLLECTION_VERSION
+
+# Версионируемые списки: все посты, все пользователи и входящие каждого пользователя
+POSTS_COLLECTION = "posts"
+USERS_COLLECTION = "users"
+# Общие списки, которые меняют все пользователи: их версия разбита на COLLECTION_VERSION_SHARDS
+# строк (posts#0, posts#1, ...), каждое изменение увеличивает случайную из них,
+# поэтому параллельные транзакции почти не ждут блокировку одной строки версии
+SHARDED_COLLECTIONS = (POSTS_COLLECTION, USERS_COLLECTION)
+
+# Функция для получения имени списка входящих пользователя
+def inbox_collection(user_id):
+    return f"inbox:{user_id}"
+
+# Функция для получения строк версии списка (для общих списков - все части)
+def collection_rows(name):
+    if name in SHARDED_COLLECTIONS:
+        return [f"{name}#{shard}" for shard in range(COLLECTION_VERSION_SHARDS)]
+    return [name]
+
+
+# Версия списка: из неё строятся заголовки ETag и Last-Modified.
+# Списка без строки в collection_versions ещё никто не менял (версия 0)
+class Version:
+    def __init__(self, version=0, updated_at=None):
+        self.etag = f'"{version}"' if updated_at is None else \
+            f'"{version}.{int(updated_at.timestamp() * 1000)}"'
+        self.last_modified = updated_at
+
+    # Заголовки ответа: клиент хранит ETag и каждый раз перепроверяет список (no-cache)
+    @property
+    def headers(self):
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(
+                self.last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+        return headers
+
+    # Проверка If-None-Match (слабое сравнение, как требует HTTP для этого заголовка)
+    def matches(self, request):
+        if_none_match = request.headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+
+# Функция для получения версии списка одним запросом по первичному ключу:
+# версия - сумма частей, время изменения - самое позднее из них
+async def collection_version(db, name):
+    row = (await db.execute(COLLECTION_VERSION, {"names": collection_rows(name)})).first()
+    return Version(*row)
+
+# Функция для ответа 304, если у клиента уже есть текущая версия списка, иначе None.
+# Вызывается до запроса страницы и сериализации
+def not_modified(request, version):
+    if version.matches(request):
+        return Response(status_code=304, headers=version.headers)
+    return None
+
+# Функция для увеличения версий списков в транзакции изменения (вызывается в конце транзакции,
+# строка версии остаётся заблокированной до commit). У общих списков увеличивается
+# случайная часть версии. Строки обновляются одним запросом в порядке имени,
+# чтобы транзакции не ждали друг друга по кругу
+async def bump_versions(db, *names):
+    table = CollectionVersion.__table__
+    rows = {random.choice(collection_rows(name)) for name in names}
+    query = pg_insert(table).values(
+        [{"name": name, "version": 1, "updated_at": func.now()} for name in sorted(rows)])
+    await db.execute(query.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": table.c.version + 1, "updated_at": query.excluded.updated_at},
+    ))
@@ -1,15 +1,115 @@
+import asyncio
+import datetime
+import logging
+import uuid
 import jwt
-from config import ALGORITHM, SECRET_KEY
+from sqlalchemy import select
+from config import (ALGORITHM, SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES,
+                    TOKEN_REVOCATION_REFRESH, TOKEN_REVOCATION_OVERLAP)
+from scheme.models import Token
+from utils.errors import unauthorized
+from utils.sqlalchemy import AsyncSessionLocal
 
-# Функция для создания jwt токена
-def create_access_token(username):
-    payload = {"sub": username}
-    return jwt.encode(payload, SECRET_KEY, ALGORITHM)  
+logger = logging.getLogger(__name__)
 
-# Функция для проверки jwt токена
+# Обязательные поля токена
+REQUIRED_CLAIMS = ["user_id", "exp", "jti"]
+
+
+# Функция для создания jwt токена с id пользователя, сроком действия и уникальным id (jti).
+# Возвращает токен, jti и время истечения
+def create_access_token(user_id, username):
+    jti = uuid.uuid4()
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    payload = {"sub": username, "user_id": user_id, "jti": str(jti), "exp": expires_at}
+    return jwt.encode(payload, SECRET_KEY, ALGORITHM), jti, expires_at
+
+# Функция для проверки jwt токена без запроса к БД: подпись, срок действия
+# и отсутствие в наборе отозванных токенов. Возвращает содержимое токена или None
 def validate_token(token):
     try:
-        payload = jwt.decode(token, SECRET_KEY, ALGORITHM)
-        return True
-    except:
-        return False
\ No newline at end of file
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM],
+                             options={"require": REQUIRED_CLAIMS})
+    except jwt.InvalidTokenError:
+        return None
+    if payload["jti"] in revoked_tokens:
+        return None
+    return payload
+
+# Функция для получения id пользователя из токена (ошибка 401, если токен недействителен)
+def token_user_id(token):
+    payload = validate_token(token)
+    if payload is None:
+        unauthorized("Упс! Вам нужно авторизироваться")
+    return payload["user_id"]
+
+# Функция для получения id пользователя из заголовка Authorization запроса
+# (для зависимостей, которые выполняются до маршрута), None без действительного токена
+def request_user_id(request):
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    payload = validate_token(token) if scheme.lower() == "bearer" and token else None
+    return payload["user_id"] if payload else None
+
+
+# Набор id (jti) отозванных, но ещё не истёкших токенов.
+# Каждый воркер держит его в памяти и периодически дочитывает новые отзывы из таблицы tokens,
+# поэтому проверка токена не обращается к БД. Истёкшие токены из набора удаляются:
+# их и так отклоняет проверка срока действия
+class RevocationSet:
+    def __init__(self, refresh_interval=TOKEN_REVOCATION_REFRESH):
+        self.refresh_interval = refresh_interval
+        self.overlap = datetime.timedelta(seconds=TOKEN_REVOCATION_OVERLAP)
+        self.expires = {}
+        self.last_revoked_at = None
+        self.task = None
+
+    def __contains__(self, jti):
+        return jti in self.expires
+
+    # Добавление отозванного токена (сразу после выхода в этом воркере)
+    def add(self, jti, expires_at):
+        self.expires[str(jti)] = expires_at
+
+    # Дочитывание токенов, отозванных после предыдущего обновления.
+    # Время отзыва ставится до фиксации транзакции, поэтому отзыв с меньшим временем может
+    # зафиксироваться позже уже прочитанного: токены перечитываются с запасом
+    # TOKEN_REVOCATION_OVERLAP секунд до самого позднего прочитанного отзыва
+    async def refresh(self):
+        now = datetime.datetime.utcnow()
+        query = select(Token.id, Token.expires_at, Token.revoked_at).where(
+            Token.revoked_at.is_not(None), Token.expires_at > now)
+        if self.last_revoked_at is not None:
+            query = query.where(Token.revoked_at >= self.last_revoked_at - self.overlap)
+        async with AsyncSessionLocal() as db:
+            for jti, expires_at, revoked_at in (await db.execute(query)).all():
+                self.add(jti, expires_at)
+                if self.last_revoked_at is None or revoked_at > self.last_revoked_at:
+                    self.last_revoked_at = revoked_at
+        # Удаление истёкших токенов из набора
+        self.expires = {jti: expires_at for jti, expires_at in self.expires.items() if expires_at > now}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Не удалось обновить список отозванных токенов")
+
+    # Если БД при запуске недоступна, воркер всё равно запускается,
+    # а отозванные токены загрузятся при следующем обновлении
+    async def start(self):
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("Не удалось загрузить список отозванных токенов")
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+# Общий набор отозванных токенов приложения
+revoked_tokens = RevocationSet()
@@ -0,0 +1,175 @@
+import logging
+import math
+import sqlite3
+import time
+from fastapi import Depends, Request
+from config import (ADMISSION_CONTROL, RATE_LIMIT_STORE, RATE_LIMIT_PATH, OVERLOAD_RETRY_AFTER,
+                    WRITE_CONCURRENCY, WRITE_RATE, WRITE_BURST,
+                    AUTH_CONCURRENCY, AUTH_RATE, AUTH_BURST)
+from utils.errors import too_many_requests, service_unavailable
+from utils.jwt import request_user_id
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Сколько ключей хранит хранилище в памяти, прежде чем удалить заполненные корзины
+MEMORY_STORE_MAX_KEYS = 100000
+# Как часто (в секундах) из общего хранилища удаляются давно не используемые корзины
+SQLITE_STORE_CLEANUP_INTERVAL = 60
+
+# Отклонённые запросы по маршрутам и причинам (rate - лимит пользователя, concurrency - перегрузка)
+REJECTED = Counter("http_requests_rejected_total", "Запросы, отклонённые ограничением нагрузки",
+                   ("route", "reason"))
+
+
+# Функция для пересчёта корзины маркеров (token bucket): корзина пополняется
+# со скоростью rate в секунду до burst. Возвращает новое число маркеров
+# и через сколько секунд повторить запрос (0, если запрос пропущен)
+def refill(tokens, updated_at, now, rate, burst):
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, math.ceil((1 - tokens) / rate)
+
+
+# Базовое хранилище корзин маркеров. Наследники определяют, где хранится состояние
+class RateLimitStore:
+    # Попытка взять маркер из корзины key, возвращает 0 или Retry-After в секундах
+    def take(self, key, rate, burst):
+        raise NotImplementedError
+
+
+# Хранилище в памяти одного процесса (один воркер, тесты)
+class InMemoryRateLimitStore(RateLimitStore):
+    def __init__(self, max_keys=MEMORY_STORE_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        tokens, updated_at, _ = self.buckets.get(key, (burst, now, now))
+        tokens, retry_after = refill(tokens, updated_at, now, rate, burst)
+        # вместе с корзиной хранится время, когда она пополнится до конца
+        self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        if len(self.buckets) > self.max_keys:
+            self.prune(now)
+        return retry_after
+
+    # Удаление корзин, которые уже пополнились до конца: они ничем не отличаются от новых
+    def prune(self, now):
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+
+
+# Хранилище в файле SQLite, общее для нескольких воркеров на одной машине
+# (файл лучше держать в /dev/shm или на локальном диске). Корзина читается
+# и обновляется в одной транзакции BEGIN IMMEDIATE, запрос занимает микросекунды,
+# поэтому выполняется прямо в event loop. Если файл занят дольше 50 мс,
+# запрос пропускается: ограничение нагрузки не должно само отклонять запросы
+class SQLiteRateLimitStore(RateLimitStore):
+    def __init__(self, path=RATE_LIMIT_PATH):
+        self.path = path
+        self.connection = None
+        self.cleaned_at = 0
+
+    # Соединение открывается при первом запросе, уже в процессе воркера
+    def connect(self):
+        connection = sqlite3.connect(self.path, isolation_level=None, timeout=0.05)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                           "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+        return connection
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        try:
+            if self.connection is None:
+                self.connection = self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                row = cursor.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?",
+                                     (key,)).fetchone()
+                tokens, retry_after = refill(*(row or (burst, now)), now, rate, burst)
+                cursor.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) "
+                               "VALUES (?, ?, ?)", (key, tokens, now))
+                if now - self.cleaned_at > SQLITE_STORE_CLEANUP_INTERVAL:
+                    # корзины, которые не использовались дольше интервала очистки
+                    cursor.execute("DELETE FROM buckets WHERE updated_at < ?",
+                                   (now - SQLITE_STORE_CLEANUP_INTERVAL,))
+                    self.cleaned_at = now
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logger.warning("Хранилище ограничений %s недоступно, запрос пропущен", self.path,
+                           exc_info=True)
+            return 0
+        return retry_after
+
+
+# Функция для создания хранилища по настройке RATE_LIMIT_STORE
+def create_rate_limit_store(kind=RATE_LIMIT_STORE):
+    stores = {"memory": InMemoryRateLimitStore, "sqlite": SQLiteRateLimitStore}
+    if kind not in stores:
+        raise ValueError(f"Неизвестное хранилище ограничений: {kind}")
+    return stores[kind]()
+
+
+# Общее хранилище корзин приложения
+rate_limits = create_rate_limit_store()
+
+
+# Функция для получения ключа ограничения по IP клиента. За балансировщиком
+# адрес клиента подставляет uvicorn из X-Forwarded-For (WEB_FORWARDED_ALLOW_IPS)
+def client_key(request):
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+# Функция для получения ключа ограничения по пользователю из токена (без запроса к БД).
+# Без действительного токена ключом служит IP клиента, сам маршрут затем вернёт 401
+def user_key(request):
+    user_id = request_user_id(request)
+    if user_id is None:
+        return client_key(request)
+    return f"user:{user_id}"
+
+
+# Функция для создания зависимости FastAPI, которая ограничивает нагрузку на маршрут:
+# - concurrency: сколько запросов маршрута одновременно обрабатывает воркер,
+#   лишние сразу получают 503 с Retry-After, а не ждут соединения из пула БД;
+# - rate и burst: корзина маркеров на ключ (пользователя или IP), при превышении 429.
+# 0 отключает соответствующее ограничение
+def admission(name, concurrency=0, rate=0, burst=1, key=user_key):
+    in_progress = 0
+
+    async def limit(request: Request):
+        nonlocal in_progress
+        if not ADMISSION_CONTROL:
+            yield
+            return
+        # Проверка перегрузки до корзины: отклонённый запрос не тратит маркер пользователя
+        if concurrency and in_progress >= concurrency:
+            REJECTED.inc(name, "concurrency")
+            service_unavailable("Сервер перегружен, попробуйте позже", OVERLOAD_RETRY_AFTER)
+        if rate:
+            retry_after = rate_limits.take(f"{name}:{key(request)}", rate, burst)
+            if retry_after:
+                REJECTED.inc(name, "rate")
+                too_many_requests("Слишком много запросов, попробуйте позже", retry_after)
+        in_progress += 1
+        try:
+            yield
+        finally:
+            in_progress -= 1
+
+    return limit
+
+
+# Функция для ограничения маршрута записи: лимит на пользователя
+def write_admission(name):
+    return Depends(admission(name, WRITE_CONCURRENCY, WRITE_RATE, WRITE_BURST))
+
+# Функция для ограничения входа и регистрации: лимит на IP клиента
+def auth_admission(name):
+    return Depends(admission(name, AUTH_CONCURRENCY, AUTH_RATE, AUTH_BURST, key=client_key))
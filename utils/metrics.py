@@ -0,0 +1,140 @@
+import time
+from bisect import bisect_left
+
+# Границы корзин гистограмм задержки в секундах (как в клиентах Prometheus)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Все метрики приложения и функции, которые добавляют метрики при выдаче /metrics
+REGISTRY = []
+COLLECTORS = []
+
+
+# Функция для форматирования меток метрики
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+# Счётчик событий (только растёт)
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, label_values)} {value}"
+
+
+# Текущее значение (растёт и уменьшается)
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+# Гистограмма: количество наблюдений по корзинам, сумма и количество.
+# Наблюдение - поиск корзины и два сложения, без выделения памяти
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        state = self.values.get(label_values)
+        if state is None:
+            # счётчики по корзинам (последняя - +Inf) и сумма наблюдений
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self):
+        label_names = self.labels + ("le",)
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(label_names, label_values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, label_values)} {cumulative}"
+
+
+# Функция для регистрации функции, которая при выдаче /metrics возвращает
+# список (имя, тип, описание, значение) - например, состояние пула соединений
+def register_collector(collector):
+    COLLECTORS.append(collector)
+
+
+# Функция для выдачи всех метрик в текстовом формате Prometheus
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    for collector in COLLECTORS:
+        for name, metric_type, documentation, value in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Метрики HTTP-запросов
+REQUESTS = Counter("http_requests_total", "Количество HTTP-запросов",
+                   ("method", "route", "status"))
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса",
+                             ("method", "route"))
+IN_PROGRESS = Gauge("http_requests_in_progress", "Запросы в обработке", ("method",))
+# Время получения соединения из пула БД
+POOL_ACQUIRE = Histogram("db_pool_acquire_seconds",
+                         "Время получения соединения из пула БД (ожидание и подключение)")
+
+
+# ASGI-middleware для сбора метрик HTTP-запросов. Маршрут берётся из шаблона пути
+# (/blog/post/{post_id}), а не из самого пути, чтобы число меток не росло
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc(method)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_PROGRESS.dec(method)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_DURATION.observe(time.perf_counter() - started, method, path)
+            REQUESTS.inc(method, path, str(status))
@@ -0,0 +1,49 @@
+import base64
+import datetime
+import uuid
+from utils.errors import bad_request
+
+# Размер страницы по умолчанию и максимальный размер страницы
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Функция для упаковки позиции (created_at, id) в непрозрачный курсор
+def encode_cursor(created_at, item_id):
+    raw = f"{created_at.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Функция для распаковки курсора обратно в (created_at, id),
+# id_type - тип id записи (uuid или целое число)
+def decode_cursor(cursor, id_type=uuid.UUID):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), id_type(item_id)
+    except ValueError:
+        bad_request("Некорректный курсор")
+
+# Функция для упаковки позиции (rank, id) результата поиска в непрозрачный курсор
+def encode_rank_cursor(rank, item_id):
+    raw = f"{rank!r}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Функция для распаковки курсора результата поиска обратно в (rank, id)
+def decode_rank_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, item_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return float(rank), uuid.UUID(item_id)
+    except ValueError:
+        bad_request("Некорректный курсор")
+
+# Функция для упаковки id последней записи страницы в непрозрачный курсор
+def encode_id_cursor(item_id):
+    return base64.urlsafe_b64encode(str(item_id).encode()).decode().rstrip("=")
+
+# Функция для распаковки курсора обратно в целочисленный id
+def decode_id_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded).decode())
+    except ValueError:
+        bad_request("Некорректный курсор")
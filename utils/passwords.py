@@ -0,0 +1,42 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import bcrypt
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+
+# Хешер bcrypt с настраиваемой стоимостью (work factor)
+_hasher = bcrypt.using(rounds=BCRYPT_ROUNDS)
+
+# Ограниченный пул потоков для хеширования: bcrypt отпускает GIL,
+# поэтому event loop не блокируется, а при всплеске входов
+# лишние задачи ждут своей очереди, а не занимают все ядра
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                               thread_name_prefix="bcrypt")
+
+# Функция для выполнения хеширования в пуле потоков
+async def _run_in_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+# Функция для проверки, что хеш создан с другой стоимостью
+def _needs_rehash(password_hash):
+    try:
+        return _hasher.from_string(password_hash).rounds != BCRYPT_ROUNDS
+    except ValueError:
+        return False
+
+# Функция для проверки пароля с перехешированием при смене стоимости
+def _verify_and_update(password, password_hash):
+    if not _hasher.verify(password, password_hash):
+        return False, None
+    if _needs_rehash(password_hash):
+        return True, _hasher.hash(password)
+    return True, None
+
+# Функция для хеширования пароля
+async def hash_password(password):
+    return await _run_in_pool(_hasher.hash, password)
+
+# Функция для проверки пароля,
+# возвращает (пароль верный, новый хеш или None)
+async def verify_password(password, password_hash):
+    return await _run_in_pool(_verify_and_update, password, password_hash)
@@ -0,0 +1,91 @@
+import contextvars
+import logging
+import time
+from collections import Counter
+from sqlalchemy import event
+from config import QUERY_BUDGET, QUERY_STRICT, QUERY_REPEAT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Статистика SQL-запросов текущего HTTP-запроса
+current_stats = contextvars.ContextVar("query_stats", default=None)
+
+
+# Ошибка строгого режима: один и тот же запрос повторяется (N+1)
+class RepeatedQueryError(Exception):
+    pass
+
+
+# Количество и суммарное время SQL-запросов одного HTTP-запроса
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+        if QUERY_STRICT and self.statements[statement] > QUERY_REPEAT_LIMIT:
+            raise RepeatedQueryError(
+                f"Запрос выполнен {self.statements[statement]} раз за HTTP-запрос: {statement}")
+
+
+# Функция для подключения учёта запросов к движку: время замеряется
+# вокруг выполнения курсора, результат пишется в статистику текущего HTTP-запроса
+def instrument(engine):
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_stats.get()
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - context._query_started)
+
+
+# ASGI-middleware для подсчёта SQL-запросов на HTTP-запрос.
+# Количество и время запросов отдаются в заголовке Server-Timing,
+# превышение QUERY_BUDGET пишется в лог.
+# Заголовки уходят вместе с первой частью тела: если ответ потоковый (NDJSON, more_body),
+# запросы ещё выполняются, и Server-Timing не добавляется, в лог попадает итог
+class QueryStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_stats.set(stats)
+
+        start_message = None
+
+        async def send_with_timing(message):
+            nonlocal start_message
+            # Начало ответа откладывается до первой части тела
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is not None:
+                if not message.get("more_body", False):
+                    timing = f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'
+                    start_message["headers"] = list(start_message.get("headers", [])) + [
+                        (b"server-timing", timing.encode())]
+                await send(start_message)
+                start_message = None
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            if stats.count > QUERY_BUDGET:
+                route = scope.get("route")
+                logger.warning("%s %s: %d SQL-запросов (бюджет %d), %.1f мс",
+                               scope["method"], route.path if route is not None else scope["path"],
+                               stats.count, QUERY_BUDGET, stats.duration * 1000)
@@ -0,0 +1,49 @@
+from sqlalchemy import Boolean, bindparam, case, literal, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+# Допустимые типы реакций
+REACTION_TYPES = ("like", "dislike")
+
+# Функция для построения одного запроса "реакция + счётчики":
+# INSERT ... ON CONFLICT (user_id, <target>) DO UPDATE меняет реакцию,
+# а UPDATE в том же запросе атомарно сдвигает likes_count/dislikes_count.
+# Запрос возвращает строку только если реакция действительно изменилась.
+# Пользователь и цель передаются при выполнении (параметры reactor_id и target_id),
+# поэтому запрос строится один раз на тип реакции (utils/statements.py)
+def reaction_upsert(reaction_model, target_model, target_key, reaction_type,
+                    *conditions, returning=()):
+    # Запрос строится на уровне Core-таблиц, без ORM-сущностей
+    reactions = reaction_model.__table__
+    target = target_model.__table__
+
+    # Вставка реакции, только если цель существует и проходит условия
+    insert_stmt = insert(reactions).from_select(
+        ["user_id", target_key, "reaction_type"],
+        select(bindparam("reactor_id", type_=reactions.c.user_id.type), target.c.id, literal(reaction_type))
+        .where(target.c.id == bindparam("target_id"), *conditions)
+    )
+    reaction = insert_stmt.on_conflict_do_update(
+        index_elements=["user_id", target_key],
+        set_={"reaction_type": insert_stmt.excluded.reaction_type},
+        where=reactions.c.reaction_type != insert_stmt.excluded.reaction_type,
+    ).returning(
+        reactions.c[target_key].label("target_id"),
+        # xmax = 0 только у только что вставленной строки
+        literal_column("(xmax = 0)", Boolean).label("inserted"),
+    ).cte("reaction")
+
+    # Если реакция была заменена, счётчик прежней реакции уменьшается
+    replaced = case((reaction.c.inserted, 0), else_=1)
+    if reaction_type == "like":
+        counters = {"likes_count": target.c.likes_count + 1,
+                    "dislikes_count": target.c.dislikes_count - replaced}
+    else:
+        counters = {"dislikes_count": target.c.dislikes_count + 1,
+                    "likes_count": target.c.likes_count - replaced}
+
+    return (
+        update(target)
+        .where(target.c.id == reaction.c.target_id)
+        .values(counters)
+        .returning(reaction.c.inserted, *returning)
+    )
@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from fastapi import Request
+from sqlalchemy import event, text
+from config import READ_YOUR_WRITES_WINDOW, REPLICA_LAG_CHECK_INTERVAL
+from utils.metrics import register_collector
+from utils.sqlalchemy import engine, read_engine, AsyncSessionLocal, ReadSessionLocal, WriteSession
+
+logger = logging.getLogger(__name__)
+
+# Cookie, в которой клиент после записи носит время её фиксации (закрепление за основной БД).
+# Закрепление хранится у клиента, поэтому его видит любой воркер и любой сервер API
+PIN_COOKIE = "primary_pin"
+
+# Запись текущего HTTP-запроса: время последней фиксации транзакции в основной БД
+current_writes = contextvars.ContextVar("primary_writes", default=None)
+
+
+class RequestWrites:
+    def __init__(self):
+        self.committed_at = None
+
+
+# Проверка отставания реплики: раз в REPLICA_LAG_CHECK_INTERVAL секунд реплика должна
+# воспроизвести WAL основной БД хотя бы до позиции, записанной на предыдущей проверке.
+# Так отставание реплики не превышает двух интервалов, иначе всё чтение идёт с основной БД.
+# caught_up_at - время, до которого реплика гарантированно видит все зафиксированные записи
+# (момент перед чтением позиции WAL, которую реплика уже воспроизвела).
+# Сервер не в режиме восстановления (например, вторая независимая БД в тестах)
+# позиции воспроизведения не имеет и считается догнавшим
+class ReplicaMonitor:
+    def __init__(self, interval=REPLICA_LAG_CHECK_INTERVAL):
+        self.interval = interval
+        self.healthy = read_engine is engine
+        self.primary_lsn = None
+        self.sampled_at = 0
+        self.caught_up_at = 0
+        self.task = None
+
+    # Текущая позиция WAL основной БД (asyncpg отдаёт pg_lsn числом)
+    # и время перед её чтением: все записи, зафиксированные раньше, до неё входят
+    async def sample_primary(self):
+        sampled_at = time.time()
+        async with engine.connect() as conn:
+            self.primary_lsn = await conn.scalar(text("SELECT pg_current_wal_lsn()"))
+        self.sampled_at = sampled_at
+
+    # Позиция WAL, которую реплика уже воспроизвела (None, если сервер не реплика)
+    async def replay_position(self):
+        async with read_engine.connect() as conn:
+            return await conn.scalar(text("SELECT pg_last_wal_replay_lsn()"))
+
+    async def check(self):
+        checked_at = time.time()
+        try:
+            replay_lsn = await self.replay_position()
+            if replay_lsn is None:
+                healthy, self.caught_up_at = True, checked_at
+            else:
+                healthy = self.primary_lsn is not None and replay_lsn >= self.primary_lsn
+                if healthy:
+                    self.caught_up_at = self.sampled_at
+            await self.sample_primary()
+        except Exception:
+            logger.debug("Не удалось проверить реплику", exc_info=True)
+            healthy = False
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Реплика догнала основную БД, чтение снова идёт с реплики")
+            else:
+                logger.warning("Реплика отстаёт или недоступна, чтение идёт с основной БД")
+        self.healthy = healthy
+
+    # Проверка, видит ли реплика запись, зафиксированную в момент committed_at
+    def has_write(self, committed_at):
+        return committed_at <= self.caught_up_at
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def start(self):
+        if read_engine is engine:
+            return
+        try:
+            await self.sample_primary()
+        except Exception:
+            logger.exception("Не удалось получить позицию WAL основной БД")
+        await self.check()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+# Проверка реплики приложения
+replica_monitor = ReplicaMonitor()
+
+
+# После фиксации транзакции в основной БД запоминается время фиксации
+# (только внутри HTTP-запроса, фоновые задачи клиента не закрепляют)
+@event.listens_for(WriteSession, "after_commit")
+def remember_commit(session):
+    writes = current_writes.get()
+    if writes is not None:
+        writes.committed_at = time.time()
+
+
+# ASGI-middleware для закрепления клиента за основной БД: если запрос что-то записал,
+# ответ ставит cookie со временем фиксации. Cookie живёт READ_YOUR_WRITES_WINDOW секунд,
+# а чтение возвращается на реплику ещё раньше - как только реплика догонит эту запись
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or read_engine is engine:
+            await self.app(scope, receive, send)
+            return
+
+        writes = RequestWrites()
+        token = current_writes.set(writes)
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and writes.committed_at is not None:
+                cookie = (f"{PIN_COOKIE}={writes.committed_at:.6f}; Max-Age={math.ceil(READ_YOUR_WRITES_WINDOW)}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            current_writes.reset(token)
+
+
+# Функция для получения времени записи клиента из cookie (None, если закрепления нет)
+def pinned_at(request):
+    try:
+        return float(request.cookies[PIN_COOKIE])
+    except (KeyError, ValueError):
+        return None
+
+
+# Функция для выдачи состояния реплики в /metrics
+def replica_metrics():
+    if read_engine is engine:
+        return []
+    return [("db_replica_healthy", "gauge", "Реплика догнала основную БД (1) или отстаёт (0)",
+             int(replica_monitor.healthy))]
+
+register_collector(replica_metrics)
+
+
+# Зависимость FastAPI для маршрутов чтения: сессия реплики, кроме случаев,
+# когда реплика ещё не догнала последнюю запись клиента или отстаёт - тогда основная БД
+async def get_read_db(request: Request):
+    session_factory = ReadSessionLocal
+    if read_engine is engine or not replica_monitor.healthy:
+        session_factory = AsyncSessionLocal
+    else:
+        committed_at = pinned_at(request)
+        if committed_at is not None and not replica_monitor.has_write(committed_at):
+            session_factory = AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
@@ -0,0 +1,47 @@
+import uuid
+import orjson
+from fastapi.responses import ORJSONResponse as BaseORJSONResponse, StreamingResponse
+from config import STREAM_BATCH_SIZE
+from utils.sqlalchemy import ReadSessionLocal
+
+# Тип содержимого для потоковой выдачи: один JSON-объект на строку
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+# Функция для сериализации типов, которые orjson не знает сам:
+# asyncpg возвращает UUID своего типа, а не uuid.UUID
+def default(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError
+
+
+# Функция для сериализации значения в JSON (bytes)
+def dumps(content):
+    return orjson.dumps(content, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Ответ, сериализуемый orjson за один проход (datetime, UUID, вложенные dict/list)
+class ORJSONResponse(BaseORJSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+# Функция для проверки, запросил ли клиент потоковую выдачу (Accept: application/x-ndjson)
+def wants_ndjson(request):
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+# Функция для потоковой выдачи результата запроса в формате NDJSON.
+# Строки читаются серверным курсором пачками по STREAM_BATCH_SIZE
+# и сразу пишутся в сокет, поэтому память воркера не зависит от размера таблицы.
+# Запрос выполняется в своей сессии реплики: сессия обработчика закрывается раньше,
+# чем клиент дочитает ответ
+def ndjson_response(query):
+    async def lines():
+        async with ReadSessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield b"".join(dumps(row._asdict()) + b"\n" for row in rows)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
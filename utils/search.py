@@ -0,0 +1,34 @@
+from sqlalchemy import func, tuple_
+from utils.errors import bad_request
+from utils.pagination import decode_rank_cursor
+
+# Конфигурация полнотекстового поиска Postgres. 'simple' не зависит от языка:
+# посты и сообщения пишутся и на русском, и на английском
+SEARCH_CONFIG = "simple"
+# Максимальная длина поискового запроса
+MAX_QUERY_LENGTH = 200
+
+# Функция для построения tsquery из пользовательской строки
+# (синтаксис как у поисковиков: слова, "фраза", -исключение, or)
+def search_query(q):
+    q = q.strip()
+    if not q or len(q) > MAX_QUERY_LENGTH:
+        bad_request(f"Поисковый запрос должен содержать от 1 до {MAX_QUERY_LENGTH} символов")
+    return func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+# Функция для добавления к запросу полнотекстового условия по GIN-индексу,
+# сортировки по релевантности и постраничной выдачи по курсору (rank, id).
+# Возвращает запрос, ранг выбирается в нём столбцом rank
+def ranked_search(query, search_vector, item_id, q, limit, cursor=None):
+    tsquery = search_query(q)
+    rank = func.ts_rank(search_vector, tsquery)
+    query = (
+        query.add_columns(rank.label("rank"))
+        .where(search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), item_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        # Продолжение выдачи после последнего результата предыдущей страницы
+        query = query.where(tuple_(rank, item_id) < decode_rank_cursor(cursor))
+    return query
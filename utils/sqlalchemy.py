@@ -1,9 +1,126 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from config import DB_USER, DB_PASS, DB_HOST, DB_NAME
+import asyncio
+import logging
+import time
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from utils.metrics import POOL_ACQUIRE, register_collector
+from utils.queries import instrument
+from utils.statements import warm_up_statements
+from config import (DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME,
+                    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_POOL_WARMUP,
+                    DB_PREPARED_STATEMENT_CACHE_SIZE, DB_REPLICA_HOST, DB_REPLICA_PORT)
+
+logger = logging.getLogger(__name__)
+
+# Функция для построения адреса подключения к БД на указанном сервере
+def database_url(host, port):
+    return URL.create(
+        "postgresql+asyncpg",
+        username=DB_USER,
+        password=DB_PASS,
+        host=host,
+        port=int(port) if port else None,
+        database=DB_NAME,
+        # Размер кеша подготовленных на сервере запросов в каждом соединении asyncpg
+        query={"prepared_statement_cache_size": str(DB_PREPARED_STATEMENT_CACHE_SIZE)},
+    )
 
 # Подключение к Базе Данных => БД
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
+DATABASE_URL = database_url(DB_HOST, DB_PORT)
+
+# Пул соединений, который замеряет время получения соединения
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_ACQUIRE.observe(time.perf_counter() - started)
 
+# Функция для создания асинхронного движка с пулом соединений
+def create_engine(url):
+    engine = create_async_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    # Учёт количества и времени SQL-запросов на HTTP-запрос
+    instrument(engine)
+    return engine
+
+# Асинхронный движок основной БД (запись и чтение после записи)
 engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Движок реплики для чтения, без реплики - тот же движок основной БД
+read_engine = create_engine(database_url(DB_REPLICA_HOST, DB_REPLICA_PORT)) if DB_REPLICA_HOST else engine
+
+# Сессия основной БД: после её commit пользователь запроса
+# на время читает с основной БД (utils/replicas.py)
+class WriteSession(Session):
+    pass
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, sync_session_class=WriteSession,
+    autoflush=False, expire_on_commit=False)
+# Сессии только для чтения с реплики
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine, class_=AsyncSession,
+    autoflush=False, expire_on_commit=False)
+
+# Функция для выдачи состояния пула соединений в /metrics
+# (пул реплики - с префиксом db_read_pool, если реплика настроена)
+def pool_metrics():
+    pools = [("db_pool", "БД", engine.pool)]
+    if read_engine is not engine:
+        pools.append(("db_read_pool", "реплики БД", read_engine.pool))
+    metrics = []
+    for prefix, title, pool in pools:
+        metrics += [
+            (f"{prefix}_size", "gauge", f"Размер пула соединений {title}", pool.size()),
+            (f"{prefix}_checked_out", "gauge", f"Соединения {title}, выданные запросам", pool.checkedout()),
+            (f"{prefix}_checked_in", "gauge", f"Свободные соединения {title} в пуле", pool.checkedin()),
+            # overflow() отрицателен, пока открыто меньше соединений, чем размер пула
+            (f"{prefix}_overflow", "gauge", f"Соединения {title} сверх размера пула", max(pool.overflow(), 0)),
+        ]
+    return metrics
+
+register_collector(pool_metrics)
+
+# Функция для открытия соединения пула и прогрева на нём частых запросов
+async def warm_up_connection(conn, write):
+    await conn.start()
+    await warm_up_statements(conn, write)
+
+# Функция для прогрева пула: size соединений открываются одновременно, на каждом
+# готовятся частые запросы (utils/statements.py), и соединения возвращаются в пул,
+# чтобы первые запросы после запуска воркера не ждали подключения к БД и компиляции SQL.
+# Ошибка прогрева не мешает запуску: недостающие соединения откроются по запросу
+async def warm_up_pool(engine, size=DB_POOL_WARMUP, write=True):
+    connections = [engine.connect() for _ in range(size)]
+    results = await asyncio.gather(*(warm_up_connection(conn, write) for conn in connections),
+                                   return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for conn in connections:
+        if conn.sync_connection is not None:
+            await conn.close()
+    if errors:
+        logger.warning("Прогрев пула: не удалось подготовить %s из %s соединений (%s)",
+                       len(errors), size, errors[0])
+
+# Функция для прогрева пулов основной БД и реплики при запуске воркера
+async def warm_up_pools():
+    await warm_up_pool(engine)
+    if read_engine is not engine:
+        await warm_up_pool(read_engine, write=False)
+
+# Зависимость FastAPI: одна сессия БД на запрос,
+# сессия закрывается (и откатывает незафиксированное) в любом случае
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
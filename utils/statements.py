@@ -0,0 +1,88 @@
+from sqlalchemy import String, any_, bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from scheme.models import CollectionVersion, Message, MessageReaction, Post, PostReaction, Token, User
+from utils.reactions import REACTION_TYPES, reaction_upsert
+
+# Запросы, которые выполняются почти в каждом HTTP-запросе, построены один раз при импорте.
+# Значения передаются параметрами при выполнении: db.scalar(POST_BY_ID, {"post_id": post_id}).
+# Готовый запрос не строится заново, его ключ кеша SQLAlchemy вычисляется один раз,
+# SQL компилируется один раз на процесс (кеш движка), а asyncpg готовит его на сервере
+# один раз на соединение (prepared statement, кеш DB_PREPARED_STATEMENT_CACHE_SIZE)
+
+# Пользователь по имени (регистрация и вход)
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+# Проверка существования пользователя
+USER_EXISTS = select(User.id).where(User.id == bindparam("user_id"))
+# Существующие пользователи из списка (получатели пакета сообщений)
+EXISTING_USERS = select(User.id).where(User.id.in_(bindparam("user_ids", expanding=True)))
+
+# Отзыв токена по идентификатору (jti). Время отзыва берётся часами БД в момент выполнения
+# (UTC, как и остальные времена токенов), а не часами воркера
+REVOKE_TOKEN = (
+    update(Token.__table__)
+    .where(Token.id == bindparam("jti"), Token.revoked_at.is_(None))
+    .values(revoked_at=func.timezone("utc", func.clock_timestamp()))
+    .returning(Token.id, Token.expires_at)
+)
+
+# Пост по идентификатору, свой пост пользователя и автор поста
+POST_BY_ID = select(Post).where(Post.id == bindparam("post_id"))
+OWN_POST = select(Post).where(Post.id == bindparam("post_id"), Post.user_id == bindparam("user_id"))
+POST_AUTHOR = select(Post.user_id).where(Post.id == bindparam("post_id"))
+
+# Неудалённое сообщение отправителя
+OWN_MESSAGE = select(Message).where(
+    Message.id == bindparam("message_id"),
+    Message.sender_id == bindparam("sender_id"),
+    Message.is_deleted == False
+)
+# Отправитель и флаг удаления сообщения (причина, по которой реакция не записалась)
+MESSAGE_STATE = select(Message.sender_id, Message.is_deleted).where(Message.id == bindparam("message_id"))
+
+# Версия списка для ETag: сумма версий строк списка и время последнего изменения
+# (= ANY(массив), чтобы SQL не зависел от числа строк)
+COLLECTION_VERSION = select(
+    func.coalesce(func.sum(CollectionVersion.version), 0), func.max(CollectionVersion.updated_at)
+).where(CollectionVersion.name == any_(bindparam("names", type_=ARRAY(String))))
+
+# Реакции на посты и сообщения по типу реакции (параметры reactor_id и target_id):
+# свои посты оценивать нельзя, свои и удалённые сообщения тоже.
+# INSERT ... ON CONFLICT SQLAlchemy не кеширует и компилирует при каждом выполнении,
+# но SQL всегда одинаков, поэтому подготовленный на сервере запрос используется повторно
+POST_REACTIONS = {
+    reaction_type: reaction_upsert(
+        PostReaction, Post, "post_id", reaction_type,
+        Post.user_id != bindparam("reactor_id"))
+    for reaction_type in REACTION_TYPES
+}
+MESSAGE_REACTIONS = {
+    reaction_type: reaction_upsert(
+        MessageReaction, Message, "message_id", reaction_type,
+        Message.sender_id != bindparam("reactor_id"),
+        Message.is_deleted == False,
+        returning=(Message.sender_id, Message.recipient_id, Message.likes_count, Message.dislikes_count))
+    for reaction_type in REACTION_TYPES
+}
+
+# Запросы для прогрева: чтение выполняется и на реплике, запись - только на основной БД.
+# Список пользователей не прогревается: его SQL зависит от длины списка
+READ_STATEMENTS = (USER_BY_USERNAME, USER_EXISTS, POST_BY_ID, OWN_POST, POST_AUTHOR,
+                   OWN_MESSAGE, MESSAGE_STATE, COLLECTION_VERSION)
+WRITE_STATEMENTS = (REVOKE_TOKEN, *POST_REACTIONS.values(), *MESSAGE_REACTIONS.values())
+
+
+# Функция для прогрева запросов на соединении пула: каждый запрос выполняется
+# с пустыми (NULL) параметрами, которым не соответствует ни одна строка, в транзакции,
+# которая затем откатывается. Так SQL компилируется в кеш движка, а соединение
+# готовит запросы на сервере до первых HTTP-запросов
+async def warm_up_statements(conn, write=True):
+    statements = READ_STATEMENTS + (WRITE_STATEMENTS if write else ())
+    async with AsyncSession(bind=conn) as db:
+        try:
+            for statement in statements:
+                # NULL передаётся только в параметры без значения (user_id, post_id, ...)
+                binds = statement.compile(dialect=conn.dialect).binds
+                await db.execute(statement, {name: None for name, bind in binds.items() if bind.required})
+        finally:
+            await db.rollback()
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from sqlalchemy import delete, func, insert, literal, or_, select, true, tuple_, union, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import (FEED_FANOUT_LIMIT, FEED_RESUME_LIMIT, FEED_BACKFILL_SIZE,
+                    FEED_BACKFILL_CHUNK, FEED_RESUME_INTERVAL)
+from scheme.models import Follow, Post, Timeline, User, POST_COLUMNS
+from utils.sqlalchemy import engine
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_COLUMNS = ["user_id", "created_at", "post_id", "author_id"]
+
+# Функция для рассылки нового поста по лентам (fan-out on write):
+# пост попадает в ленту автора и в ленты всех подписчиков,
+# если рассылка автора не приостановлена (fanout_paused). Выполняется одним запросом.
+# Строка автора блокируется на чтение (FOR SHARE) до конца транзакции: возобновление
+# рассылки (FanoutResumer) дожидается поста, а пост после возобновления уже рассылается
+async def fan_out_post(db, post_id, author_id, created_at):
+    fanout_enabled = (
+        select(~User.fanout_paused & (User.followers_count < FEED_FANOUT_LIMIT))
+        .where(User.id == author_id)
+        .with_for_update(read=True)
+        .scalar_subquery()
+    )
+    own_row = select(literal(author_id), literal(created_at), literal(post_id), literal(author_id))
+    follower_rows = (
+        select(Follow.follower_id, literal(created_at), literal(post_id), literal(author_id))
+        .where(Follow.followee_id == author_id, fanout_enabled)
+    )
+    await db.execute(
+        insert(Timeline.__table__)
+        .from_select(TIMELINE_COLUMNS, union_all(own_row, follower_rows))
+    )
+
+# Функция для изменения счётчика подписчиков автора (delta = 1 при подписке, -1 при отписке).
+# Если подписчиков до или после изменения не меньше FEED_FANOUT_LIMIT, рассылка постов
+# приостанавливается, а посты автора подмешиваются в ленты при чтении. Обратно рассылку
+# включает только FanoutResumer, когда подписчиков становится меньше FEED_RESUME_LIMIT
+async def change_followers_count(db, author_id, delta):
+    users = User.__table__
+    above_limit = or_(users.c.followers_count >= FEED_FANOUT_LIMIT,
+                      users.c.followers_count + delta >= FEED_FANOUT_LIMIT)
+    await db.execute(
+        update(users)
+        .where(users.c.id == author_id)
+        .values(followers_count=users.c.followers_count + delta,
+                fanout_paused=users.c.fanout_paused | above_limit,
+                feed_merged=users.c.feed_merged | above_limit)
+    )
+
+# Функция для добавления последних постов автора в ленту нового подписчика
+async def backfill_timeline(db, user_id, author_id):
+    recent_posts = (
+        select(literal(user_id), Post.created_at, Post.id, Post.user_id)
+        .where(Post.user_id == author_id)
+        .order_by(Post.created_at.desc())
+        .limit(FEED_BACKFILL_SIZE)
+    )
+    await db.execute(
+        pg_insert(Timeline.__table__)
+        .from_select(TIMELINE_COLUMNS, recent_posts)
+        .on_conflict_do_nothing()
+    )
+
+# Функция для добавления последних постов автора в ленты части его подписчиков
+# (не больше FEED_BACKFILL_CHUNK подписчиков с follower_id больше after_id).
+# Возвращает последний обработанный follower_id или None, если подписчики закончились
+async def backfill_followers_chunk(conn, author_id, after_id):
+    follower_ids = (await conn.scalars(
+        select(Follow.follower_id)
+        .where(Follow.followee_id == author_id, Follow.follower_id > after_id)
+        .order_by(Follow.follower_id)
+        .limit(FEED_BACKFILL_CHUNK)
+    )).all()
+    if not follower_ids:
+        return None
+    recent_posts = (
+        select(Post.created_at, Post.id)
+        .where(Post.user_id == author_id)
+        .order_by(Post.created_at.desc())
+        .limit(FEED_BACKFILL_SIZE)
+        .subquery("recent_posts")
+    )
+    follower_rows = (
+        select(Follow.follower_id, recent_posts.c.created_at, recent_posts.c.id, literal(author_id))
+        .join(recent_posts, true())
+        .where(Follow.followee_id == author_id, Follow.follower_id.in_(follower_ids))
+    )
+    await conn.execute(
+        pg_insert(Timeline.__table__)
+        .from_select(TIMELINE_COLUMNS, follower_rows)
+        .on_conflict_do_nothing()
+    )
+    return follower_ids[-1]
+
+# Функция для удаления постов автора из ленты отписавшегося пользователя
+async def remove_author_from_timeline(db, user_id, author_id):
+    await db.execute(
+        delete(Timeline.__table__)
+        .where(Timeline.user_id == user_id, Timeline.author_id == author_id)
+    )
+
+# Функция для построения запроса одной страницы ленты пользователя:
+# диапазон по первичному ключу timelines (user_id, created_at, post_id)
+# плюс посты авторов, которые подмешиваются при чтении (fan-out on read, feed_merged)
+# по индексу posts (user_id, created_at, id). Повторы убираются UNION
+def feed_page_query(user_id, limit, cursor_position=None):
+    timeline_rows = (
+        select(Timeline.post_id, Timeline.created_at)
+        .where(Timeline.user_id == user_id)
+    )
+    popular_authors = (
+        select(Follow.followee_id)
+        .join(User, User.id == Follow.followee_id)
+        .where(Follow.follower_id == user_id,
+               or_(User.feed_merged, User.followers_count >= FEED_FANOUT_LIMIT))
+    )
+    popular_rows = (
+        select(Post.id.label("post_id"), Post.created_at)
+        .where(Post.user_id.in_(popular_authors))
+    )
+    if cursor_position:
+        timeline_rows = timeline_rows.where(
+            tuple_(Timeline.created_at, Timeline.post_id) < cursor_position)
+        popular_rows = popular_rows.where(
+            tuple_(Post.created_at, Post.id) < cursor_position)
+    timeline_rows = timeline_rows.order_by(
+        Timeline.created_at.desc(), Timeline.post_id.desc()).limit(limit)
+    popular_rows = popular_rows.order_by(
+        Post.created_at.desc(), Post.id.desc()).limit(limit)
+
+    page = union(timeline_rows, popular_rows).subquery("page")
+    return (
+        select(*POST_COLUMNS)
+        .join(page, Post.id == page.c.post_id)
+        .order_by(page.c.created_at.desc(), page.c.post_id.desc())
+        .limit(limit)
+    )
+
+
+# Фоновое возобновление рассылки постов авторов, у которых подписчиков стало меньше
+# FEED_RESUME_LIMIT (ниже FEED_FANOUT_LIMIT, чтобы подписки и отписки у границы
+# не запускали заполнение лент снова и снова). Для каждого автора:
+# 1. рассылка новых постов включается (fanout_paused = false), посты автора
+#    по-прежнему подмешиваются в ленты при чтении;
+# 2. последние посты автора добавляются в ленты подписчиков пакетами
+#    по FEED_BACKFILL_CHUNK подписчиков, каждый пакет в своей транзакции;
+# 3. подмешивание при чтении выключается (feed_merged = false), если за это время
+#    рассылка не была снова приостановлена.
+# Воркеры делят авторов через advisory-блокировку на соединении: если воркер упал
+# посреди заполнения, блокировка снимается, и автора подхватит следующая проверка
+class FanoutResumer:
+    LOCK_KEY = 7_140_002
+
+    def __init__(self, interval=FEED_RESUME_INTERVAL):
+        self.interval = interval
+        self.task = None
+
+    async def resume(self, conn, author_id):
+        resumed = await conn.scalar(
+            update(User.__table__)
+            .where(User.id == author_id, User.feed_merged,
+                   User.followers_count < FEED_RESUME_LIMIT)
+            .values(fanout_paused=False)
+            .returning(User.id)
+        )
+        await conn.commit()
+        if resumed is None:
+            return
+        after_id = 0
+        while after_id is not None:
+            after_id = await backfill_followers_chunk(conn, author_id, after_id)
+            await conn.commit()
+        await conn.execute(
+            update(User.__table__)
+            .where(User.id == author_id, User.fanout_paused == False)
+            .values(feed_merged=False)
+        )
+        await conn.commit()
+
+    async def check(self):
+        async with engine.connect() as conn:
+            author_ids = (await conn.scalars(
+                select(User.id)
+                .where(User.feed_merged, User.followers_count < FEED_RESUME_LIMIT)
+                .limit(100)
+            )).all()
+            await conn.commit()
+            for author_id in author_ids:
+                locked = await conn.scalar(select(func.pg_try_advisory_lock(self.LOCK_KEY, author_id)))
+                await conn.commit()
+                if not locked:
+                    continue
+                try:
+                    await self.resume(conn, author_id)
+                finally:
+                    await conn.rollback()
+                    await conn.scalar(select(func.pg_advisory_unlock(self.LOCK_KEY, author_id)))
+                    await conn.commit()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Не удалось возобновить рассылку постов")
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+# Общий планировщик возобновления рассылки приложения
+fanout_resumer = FanoutResumer()